@@ -61,12 +61,14 @@ def create(name):
 
 
 @migrations.command(help='Merge branches or heads')
-def merge():
+@click.option('--auto', is_flag=True,
+              help='Merge all heads by one revision without questions')
+def merge(auto):
     """
     Start merging heads if there are more then one
     """
     from faq_migrations.source.alembic_wrapper import AlembicMigrations
-    AlembicMigrations().merge()
+    AlembicMigrations().merge(auto)
 
 
 @migrations.command(help='Show last created migration from files')
@@ -86,18 +88,71 @@ def last_revision():
 
 
 @migrations.command(help='Upgrade to head')
-def migrate():
+@click.option('--targets', type=click.File(),
+              help='File with database urls, one per line')
+@click.option('--jobs', default=4, help='Databases upgraded in parallel')
+@click.option('--sql', is_flag=True,
+              help='Print SQL script instead of upgrading database')
+@click.option('--transaction-mode',
+              type=click.Choice(['all', 'per-migration', 'batch']),
+              help='One transaction for all migrations, transaction per '
+                   'migration or per batch, env.py layout by default')
+@click.option('--batch-size', default=100,
+              help='Migrations in one transaction of batch mode')
+@click.argument('revision_range', required=False)
+def migrate(targets, jobs, sql, transaction_mode, batch_size,
+            revision_range):
     """
     Run migrations to available HEAD
     """
-    from faq_migrations.source.alembic_wrapper import AlembicMigrations
+    from faq_migrations.source.alembic_wrapper import (AlembicMigrations,
+                                                       FAILED)
+
+    if sql:
+        AlembicMigrations().migrate_sql(revision_range)
+        return
+
+    if targets:
+        database_urls = [
+            line.strip() for line in targets
+            if line.strip() and not line.strip().startswith('#')
+        ]
+        results = AlembicMigrations.migrate_targets(
+            database_urls, jobs, transaction_mode, batch_size
+        )
+
+        for database_url, status, error in results:
+            print('{}: {}{}'.format(
+                database_url, status, ' ({})'.format(error) if error else ''
+            ))
+
+        failed = len([result for result in results if result[1] == FAILED])
+
+        if failed:
+            raise SystemExit(
+                f'Upgrade failed on {failed} of {len(results)} databases'
+            )
+
+        return
 
     am = AlembicMigrations()
 
-    if am.migrate() is False:
+    if am.migrate(transaction_mode, batch_size) is False:
         print('\nYou must merge branches first\n')
         am.merge()
-        am.migrate()
+        am.migrate(transaction_mode, batch_size)
+
+
+@migrations.command(help='Create schema of empty database from snapshot')
+def bootstrap():
+    """
+    Restore snapshot of migrated schema into empty database, snapshot is
+    captured by running of migrations when migration files are changed
+    """
+    from faq_migrations.source.alembic_wrapper import AlembicMigrations
+
+    if AlembicMigrations().bootstrap() is False:
+        raise SystemExit('You must merge branches first')
 
 
 @migrations.command(help='Downgrade from current head on few migrations')
@@ -112,16 +167,18 @@ def downgrade(amount):
     am.downgrade(amount)
 
 
-@migrations.command(help='Downgrade migrations passed as list of revisions')
+@migrations.command(help='Downgrade migrations passed as list of revisions '
+                    'and their applied descendants')
 @click.argument('revisions', default=[])
-def downgrade_heads(revisions):
+@click.option('--dry-run', is_flag=True, help='Only show downgrade plan')
+def downgrade_heads(revisions, dry_run):
     """
-    Run migrations to available HEAD
+    Downgrade specific revisions in one transaction
     """
     from faq_migrations.source.alembic_wrapper import AlembicMigrations
 
     am = AlembicMigrations()
-    am.downgrade(revisions.split(','))
+    am.downgrade_heads(revisions.split(','), dry_run)
 
 
 @migrations.command(help='Show last migration, limit=20, upper=True')
@@ -143,9 +200,8 @@ def history(limit=20, upper=True, verbose=False):
     for revision in revisions:
 
         if verbose:
-            script = am.get_revision(revision.revision)
             print('{}({}): {}'.format(
-                revision, am.branch_name(revision), script.log_entry
+                revision, am.branch_name(revision), revision.log_entry
             ))
             continue
 
@@ -154,13 +210,41 @@ def history(limit=20, upper=True, verbose=False):
         )
 
 
+@migrations.command(help='Show the slowest migration steps')
+@click.option('--database', multiple=True,
+              help='Database url of environment, may be passed few times')
+@click.option('--limit', default=20)
+def timings(database, limit):
+    """
+    Show migration steps which took the most time across environments
+    """
+    from faq_migrations.source.alembic_wrapper import AlembicMigrations
+
+    for step in AlembicMigrations().timings(list(database), limit):
+        print('{revision} {direction}: runs={count} avg={avg:.3f}s '
+              'max={max:.3f}s total={total:.3f}s'.format(
+                  avg=step['total'] / step['count'], **step
+              ))
+
+
+@migrations.command(help='Squash revision and its ancestors into baseline')
+@click.argument('revision')
+def squash(revision):
+    """
+    Replace old migrations by one baseline generated from database schema
+    :param revision: the last squashed revision, database must be at it
+    """
+    from faq_migrations.source.alembic_wrapper import AlembicMigrations
+    AlembicMigrations().squash(revision)
+
+
 @migrations.command(help="Show not yet applied migrations")
 def upgrade_migrations():
     """
     Show not yet applied migrations
     """
     from faq_migrations.source.alembic_wrapper import AlembicMigrations
-    print(AlembicMigrations().upgrade_revisions(AlembicMigrations().current()))
+    print(AlembicMigrations().upgrade_revisions())
 
 
 @migrations.command(help="Compare local and remote history")
@@ -1,15 +1,41 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session
 
 from faq_migrations.settings import config
 
 
-db_connection = config.database_url
-engine = create_engine(db_connection)
+_engines = {}
+
+
+def get_engine(database_url=None):
+    """
+    Get engine bound to the database url. Engine is created on first use and
+    cached per url, so changing of config.database_url is respected
+
+    :param database_url: database url, config.database_url by default
+    :return: Engine
+    """
+    database_url = database_url or config.database_url
+
+    if not database_url:
+        raise ValueError('Please setup config.database_url param')
+
+    if database_url not in _engines:
+        _engines[database_url] = create_engine(database_url)
+
+    return _engines[database_url]
+
+
+def dispose_engine(database_url):
+    """
+    Close pooled connections of engine of the database url and forget it
+
+    :param database_url: database url
+    """
+    engine = _engines.pop(database_url, None)
+
+    if engine is not None:
+        engine.dispose()
 
-meta = MetaData()
-meta.reflect(bind=engine)
 
-db_session = Session(bind=engine)
 Base = declarative_base()
@@ -1,9 +1,21 @@
+import ast
+
 from alembic import op
 
-from sqlalchemy import Column, Integer, String
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+
+from sqlalchemy import (Column, DateTime, Float, Index, Integer, String,
+                        inspect, or_, true)
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm.session import Session
 
-from . import Base, db_session, engine, MetaData
+from . import Base
+
+
+UPGRADE = 'upgrade'
+DOWNGRADE = 'downgrade'
 
 
 class VersionHistory(Base):
@@ -13,10 +25,64 @@ class VersionHistory(Base):
     from_ver = Column(String, nullable=False)
     to_ver = Column(String, nullable=False)
 
+    # timing of migration step
+    started_at = Column(DateTime, nullable=True)
+    duration = Column(Float, nullable=True)
+    direction = Column(String, nullable=True)
+    git_branch = Column(String, nullable=True)
+
+    # lookups by to_ver and by (to_ver, from_ver) use the same index
+    __table_args__ = (
+        Index('ix_alembic_version_history_to_ver_from_ver',
+              'to_ver', 'from_ver'),
+    )
+
     def __init__(self, previous_revision, forward_revision):
         self.from_ver = previous_revision
         self.to_ver = forward_revision
 
+    @classmethod
+    def applied(cls, columns=None):
+        """
+        Filter of rows of applied migrations. Rows of downgrade steps are kept
+        only for timings, rows written by previous versions have no direction
+
+        :param columns: columns of the table, see history_columns. Table of
+        previous versions has no direction column, all its rows are applied
+        :return: sql expression
+        """
+        if columns is not None and 'direction' not in columns:
+            return true()
+
+        return or_(cls.direction.is_(None), cls.direction == UPGRADE)
+
+    @staticmethod
+    def format_revision(revision):
+        """
+        Revision as it is stored in the table. Merge points are stored as
+        string of tuple
+
+        :param revision: revision id, list or tuple of ids
+        :return: string
+        """
+        if type(revision) in (list, tuple):
+            return str(tuple(revision))
+
+        return str(revision)
+
+    @staticmethod
+    def parse_revision(revision):
+        """
+        Revision from the table as alembic target
+
+        :param revision: from_ver or to_ver value
+        :return: revision id or tuple of ids
+        """
+        if revision.startswith('('):
+            return tuple(ast.literal_eval(revision))
+
+        return revision
+
     @staticmethod
     def alembic_session():
         return Session(bind=op.get_context().bind)
@@ -25,22 +91,36 @@ class VersionHistory(Base):
         result = self.alembic_session().query(VersionHistory)\
             .filter(VersionHistory.to_ver == self.to_ver)\
             .filter(VersionHistory.from_ver == self.from_ver)\
+            .filter(VersionHistory.applied())\
             .first()
 
         return True if not result else False
 
-    def list(self, offset=0, limit=0):
-        return self.alembic_session().query(VersionHistory)\
-            .filter()\
-            .order_by(VersionHistory.id.desc()) \
-            .offset(offset) \
-            .limit(limit)
+    def list(self, before_id=None, limit=20):
+        """
+        Page of history, new migrations at the top. Keyset pagination is
+        used, so every page costs the same
+
+        :param before_id: id of the last row of previous page
+        :param limit: size of page
+        :return: query of VersionHistory
+        """
+        columns = history_columns(op.get_bind())
+
+        # timing columns are missing in table of previous versions
+        query = self.alembic_session().query(VersionHistory).options(
+            load_only(*[column.name for column in VersionHistory.__table__.c
+                        if column.name in columns])
+        )
+
+        if before_id is not None:
+            query = query.filter(VersionHistory.id < before_id)
+
+        return query.order_by(VersionHistory.id.desc()).limit(limit)
 
     def save(self):
 
-        if not engine.dialect.has_table(engine, self.__tablename__):
-            metadata = MetaData(engine)
-            metadata.create_all()
+        ensure_history_table(op.get_bind())
 
         if self.check_for_copy():
             self.alembic_session().add(self)
@@ -53,6 +133,76 @@ class VersionHistory(Base):
                f"{self.to_ver}>"
 
 
+def history_columns(bind):
+    """
+    Names of columns of alembic_version_history in database. Read commands
+    adapt their queries to them instead of altering of the table
+
+    :param bind: Engine or Connection
+    :return: set of names, empty set if table does not exist
+    """
+    table = VersionHistory.__table__
+
+    if not bind.dialect.has_table(bind, table.name):
+        return set()
+
+    return {column['name']
+            for column in inspect(bind).get_columns(table.name)}
+
+
+def ensure_history_table(bind):
+    """
+    Create alembic_version_history with its indexes. Columns and indexes
+    missing in tables created by previous versions are added. Objects created
+    by concurrent process at the same moment are accepted
+
+    :param bind: Engine or Connection
+    """
+    table = VersionHistory.__table__
+
+    if not bind.dialect.has_table(bind, table.name):
+        try:
+            table.create(bind=bind)
+            return
+        except DBAPIError:
+            if not bind.dialect.has_table(bind, table.name):
+                raise
+
+    def columns():
+        return history_columns(bind)
+
+    def indexes():
+        return {index['name']
+                for index in inspect(bind).get_indexes(table.name)}
+
+    existing = columns()
+    missing = [column for column in table.columns
+               if column.name not in existing]
+
+    if missing:
+        with bind.connect() as connection:
+            operations = Operations(MigrationContext.configure(connection))
+
+            for column in missing:
+                try:
+                    operations.add_column(table.name, Column(
+                        column.name, column.type, nullable=True
+                    ))
+                except DBAPIError:
+                    if column.name not in columns():
+                        raise
+
+    existing = indexes()
+
+    for index in table.indexes:
+        if index.name not in existing:
+            try:
+                index.create(bind=bind)
+            except DBAPIError:
+                if index.name not in indexes():
+                    raise
+
+
 class VersionNumber(Base):
     __tablename__ = 'alembic_version'
 
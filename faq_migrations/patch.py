@@ -1,46 +1,178 @@
-from alembic.runtime.migration import HeadMaintainer, MigrationStep
+import time
+from datetime import datetime
 
-from faq_migrations.models import db_session
-from faq_migrations.models.history import VersionHistory
+from sqlalchemy import func
+
+from alembic.runtime import migration
+from alembic.runtime.migration import HeadMaintainer, MigrationContext
+
+from faq_migrations.models.history import VersionHistory, UPGRADE, DOWNGRADE
+
+
+# transaction layouts of `migrate --transaction-mode`
+ALL = 'all'
+PER_MIGRATION = 'per-migration'
+BATCH = 'batch'
+TRANSACTION_MODES = (ALL, PER_MIGRATION, BATCH)
+
+original_init = MigrationContext.__init__
+original_run_migrations = MigrationContext.run_migrations
+
+
+def init(self, dialect, connection, opts, *args, **kwargs):
+    """
+    MigrationContext.__init__ which applies transaction mode passed into
+    EnvironmentContext. It must be done before env.py opens its transaction
+    """
+    original_init(self, dialect, connection, opts, *args, **kwargs)
+
+    transaction_mode = opts.get('transaction_mode')
+
+    if transaction_mode is not None:
+        # env.py transaction is not opened, batches open their own ones
+        self._transaction_per_migration = transaction_mode != ALL
+
+
+def run_steps(self, **kw):
+    """
+    Run migrations and write buffered history rows of PatchedHeadMaintainer
+    when all steps were done. It is called inside of transaction, so history
+    is committed only together with steps. Steps done before failure are
+    written too, unless they are rolled back together with transaction
+    """
+    failed = True
+
+    try:
+        original_run_migrations(self, **kw)
+        failed = False
+    finally:
+        head_maintainer = getattr(self, 'history_head_maintainer', None)
+
+        if head_maintainer is not None:
+            if failed and self.impl.transactional_ddl:
+                # rows of steps rolled back together with transaction
+                head_maintainer.history = []
+            else:
+                head_maintainer.flush()
+
+
+def run_migrations(self, **kw):
+    """
+    MigrationContext.run_migrations which writes history of steps. In batch
+    mode steps are split into chunks and every chunk is committed in its own
+    transaction together with its history
+    """
+    batch_size = self.opts.get('batch_size')
+
+    if self.opts.get('transaction_mode') != BATCH or not batch_size:
+        return run_steps(self, **kw)
+
+    migrations_fn = self._migrations_fn
+    steps = list(migrations_fn(self.get_current_heads(), self))
+
+    try:
+        for start in range(0, len(steps), batch_size):
+            chunk = steps[start:start + batch_size]
+            self._migrations_fn = lambda heads, context, chunk=chunk: chunk
+
+            # steps of chunk don't open transactions, chunk opens one
+            self._transaction_per_migration = False
+
+            try:
+                with self.begin_transaction():
+                    run_steps(self, **kw)
+            finally:
+                self._transaction_per_migration = True
+    finally:
+        self._migrations_fn = migrations_fn
 
 
 class PatchedHeadMaintainer(HeadMaintainer):
     def __init__(self, context, heads):
         super(PatchedHeadMaintainer, self).__init__(context, heads)
 
+        # rows of alembic_version_history waiting for commit
+        self.history = []
+        context.history_head_maintainer = self
+
+        # step starts right after previous one is stamped
+        self.__start_step__()
+
+    def __start_step__(self):
+        self.step_started_at = datetime.utcnow()
+        self.step_clock = time.perf_counter()
+
     def update_to_step(self, step):
         super(PatchedHeadMaintainer, self).update_to_step(step)
 
+        duration = time.perf_counter() - self.step_clock
         script = step.revision
-        down_revision = script.module.down_revision
-
-        # it may be a list when revision in merge point
-        if type(down_revision) in (list, tuple):
-            down_revision = str(script.module.down_revision)
-
-        # initial migration. Skip initial migration
-        if down_revision:
-            # Create log file in current alembic opened session that used
-            # in migrations context
-            self.context.connection.execute(
-                VersionHistory.__table__.insert(),
-                from_ver=down_revision,
-                to_ver=script.module.revision
-            )
-
-
-class MigrationStepPatched(MigrationStep):
-
-    @classmethod
-    def downgrade_from_script(cls, revision_map, script):
-        a = super(MigrationStepPatched, cls).downgrade_from_script(
-            revision_map, script
-        )
-        print('RESULT OF MIGRATION : ', a)
-        db_session.delete(
-            db_session.query(VersionHistory).filter(
-                VersionHistory.to_ver == script.revision
-            ).first()
-        )
-        db_session.commit()
-        return a
+        git_branch = getattr(script.module, 'git_branch', None)
+        squashed = getattr(script.module, 'squashed', None)
+
+        if squashed and step.is_upgrade:
+            # baseline restores history of revisions squashed into it, time
+            # of the step belongs to the row of baseline revision
+            for to_ver, from_ver in squashed:
+                self.history.append(dict(
+                    from_ver=from_ver,
+                    to_ver=to_ver,
+                    started_at=self.step_started_at,
+                    duration=duration if to_ver == script.revision else None,
+                    direction=UPGRADE,
+                    git_branch=git_branch
+                ))
+
+        # initial migration. Skip initial migration. Rows of downgrade steps
+        # are used only for timings, applied rows are removed by downgrade
+        elif script.down_revision:
+            self.history.append(dict(
+                # it may be a tuple when revision in merge point
+                from_ver=VersionHistory.format_revision(script.down_revision),
+                to_ver=script.revision,
+                started_at=self.step_started_at,
+                duration=duration,
+                direction=UPGRADE if step.is_upgrade else DOWNGRADE,
+                git_branch=git_branch
+            ))
+
+        # every step is committed separately, history must be written
+        # inside of its transaction. Without transactional DDL (SQLite,
+        # MySQL) the step and alembic_version are already committed. Offline
+        # script gets inserts right after statements of the step
+        if self.context.as_sql or self.context._transaction_per_migration \
+                or not self.context.impl.transactional_ddl:
+            self.flush()
+
+        self.__start_step__()
+
+    def flush(self):
+        """
+        Write buffered history with one multi-row insert in current alembic
+        opened session that used in migrations context
+        """
+        if not self.history:
+            return
+
+        table = VersionHistory.__table__
+
+        if self.context.as_sql:
+            # SQL script has no parameters, timing is unknown until it is run
+            for row in self.history:
+                row = dict(row, started_at=func.current_timestamp())
+                del row['duration']
+
+                self.context.impl._exec(table.insert().values(row))
+        else:
+            self.context.connection.execute(table.insert(), self.history)
+
+        self.history = []
+
+
+def install():
+    """
+    Monkey-Patch of alembic for adding logging into migration process
+    """
+    migration.HeadMaintainer = PatchedHeadMaintainer
+    MigrationContext.__init__ = init
+    MigrationContext.run_migrations = run_migrations
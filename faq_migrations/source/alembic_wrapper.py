@@ -1,22 +1,106 @@
+import multiprocessing
 import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from functools import partial
 
-from sqlalchemy import create_engine
+from sqlalchemy import MetaData, func, literal, select
 
+from alembic.runtime.environment import EnvironmentContext
 from alembic.runtime.migration import MigrationContext
 from alembic.script import ScriptDirectory
 from alembic.config import Config
 from alembic import command, util
 
 from faq_migrations.settings import config
-from faq_migrations.models import db_session
-from faq_migrations.models.history import VersionHistory, VersionNumber
+from faq_migrations.models import dispose_engine, get_engine
+from faq_migrations.models.history import (VersionHistory, VersionNumber,
+                                           ensure_history_table,
+                                           history_columns, DOWNGRADE)
+from faq_migrations.source.attribution import ATTRIBUTION_FILE, \
+    GitAttribution
+from faq_migrations.source.git_repo import commit_time, current_branch
+from faq_migrations.source.header import read_header
+from faq_migrations.source.history_file import (is_history_file,
+                                                read_history, write_history)
+from faq_migrations.source.lock import LOCK_TABLE, MigrationLock, \
+    POLL_INTERVAL
+from faq_migrations.source.script_index import INDEX_FILE, ScriptIndex, \
+    to_tuple
+from faq_migrations.source.snapshot import SNAPSHOTS_DIR, SchemaSnapshot
+from faq_migrations.source.squash import archive, baseline_tables, \
+    render_baseline
+from faq_migrations.source.sql_cache import SQL_CACHE_DIR, SqlCache
+
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+AT_HEAD = 'already at head'
+
+# branch of migration which has no git_branch and is not committed
+NO_BRANCH = 'no branch'
+
+# caches of config.alembic_dir, they are valid only for one checkout
+LOCAL_CACHES = (INDEX_FILE, ATTRIBUTION_FILE, SQL_CACHE_DIR + '/',
+                SNAPSHOTS_DIR + '/')
+
+# ScriptDirectory shared with workers of AlembicMigrations.migrate_targets
+_shared_script = None
+
+
+def _load_script(settings):
+    """
+    Initializer of spawned worker of AlembicMigrations.migrate_targets. It
+    gets config of parent process and parses migration files once
+
+    :param settings: attributes of config
+    """
+    global _shared_script
+
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+    _shared_script = LowLevelApi().script
+    _shared_script.revision_map.heads
+
+
+def _migrate_target(database_url, transaction_mode=None, batch_size=100):
+    """
+    Upgrade one database in worker process. Worker is reused for other
+    databases, so its connection and engine are released at the end
+
+    :param database_url: database url
+    :param transaction_mode: see AlembicMigrations.migrate
+    :param batch_size: see AlembicMigrations.migrate
+    :return: tuple of url, status and error message
+    """
+    migrations = None
+
+    try:
+        migrations = AlembicMigrations(database_url, _shared_script)
+        result = migrations.migrate(transaction_mode, batch_size)
+    except Exception as e:
+        return database_url, FAILED, '{}: {}'.format(type(e).__name__, e)
+    finally:
+        if migrations is not None:
+            migrations.close()
+
+        dispose_engine(database_url)
+
+    return database_url, AT_HEAD if result is None else SUCCEEDED, ''
 
 
 class LowLevelApi:
 
-    def __init__(self):
+    def __init__(self, database_url=None, script=None):
         """
         Load necessary alembic objects such ans Script and Context
+
+        :param database_url: database url, overrides config.database_url and
+        sqlalchemy.url of alembic.ini
+        :param script: already loaded ScriptDirectory, it is shared between
+        instances which work with different databases
         """
 
         if not config.alembic_dir:
@@ -24,26 +108,125 @@ class LowLevelApi:
 
         # loading alembic.ini config from installed path
         self.init_config = Config(config.alembic_dir + 'alembic.ini')
+        self._database_url = None
+
+        if database_url:
+            self.__database_url__ = database_url
+
+        # database connection and Alembic Context are created on first use,
+        # commands which work only with files never touch the database
+        self._engine = None
+        self._conn = None
+        self._context = None
+
+        # ScriptDirectory and revision index are built once per instance
+        self._script = script
+        self._index = None
+        self._attribution = None
+
+    @property
+    def engine(self):
+        """
+        Get database engine
+
+        :return: Engine based on database url
+        """
+
+        if self._engine is None:
+            self._engine = get_engine(self.__database_url__)
+
+        return self._engine
+
+    @property
+    def conn(self):
+        """
+        Get database connection
+
+        :return: Connection opened on first access
+        """
+
+        if self._conn is None:
+            self._conn = self.engine.connect()
+
+        return self._conn
+
+    def close(self):
+        """
+        Return connection into pool of engine, it is opened again on next use
+        """
+        if self._conn is not None:
+            self._conn.close()
+
+        self._conn = None
+        self._context = None
 
-        # create database connection
-        self.engine = create_engine(self.__database_url__)
-        self.conn = self.engine.connect()
+    @property
+    def context(self):
+        """
+        Get Alembic Context
+
+        :return: MigrationContext configured with database connection
+        """
+
+        if self._context is None:
+            self._context = MigrationContext.configure(self.conn)
 
-        # and load Alembic Context
-        self.context = MigrationContext.configure(self.conn)
+        return self._context
 
     @property
     def script(self):
         """
-        Get ScripDirectory
+        Get ScripDirectory. Revision map of it is loaded only once
 
         :return: ScripDirectory Object based on config.alembic_dir
         """
 
-        if not os.path.exists(config.alembic_dir):
-            raise Exception('Dir {} not found'.format(config.alembic_dir))
+        if self._script is None:
+
+            if not os.path.exists(config.alembic_dir):
+                raise Exception('Dir {} not found'.format(config.alembic_dir))
+
+            self._script = ScriptDirectory.from_config(self.init_config)
+
+        return self._script
+
+    @property
+    def index(self):
+        """
+        Get persistent index of migration headers
+
+        :return: ScriptIndex Object based on config.alembic_dir
+        """
+
+        if self._index is None:
+
+            if not os.path.exists(config.alembic_dir):
+                raise Exception('Dir {} not found'.format(config.alembic_dir))
+
+            self._index = ScriptIndex(config.alembic_dir).load()
+
+        return self._index
+
+    @property
+    def attribution(self):
+        """
+        Get git attribution of migration files
+
+        :return: GitAttribution Object based on config.alembic_dir
+        """
+
+        if self._attribution is None:
+            self._attribution = GitAttribution(config.alembic_dir).load()
 
-        return ScriptDirectory.from_config(self.init_config)
+        return self._attribution
+
+    def __reset_cache__(self):
+        """
+        Drop cached ScriptDirectory and revision index. Must be called after
+        writing of new migration files
+        """
+        self._script = None
+        self._index = None
 
     @property
     def __database_url__(self):
@@ -53,21 +236,40 @@ class LowLevelApi:
 
         :return: database url
         """
-        return config.database_url or self.init_config.get_section_option(
-            'alembic', 'sqlalchemy.url'
-        )
+        return self._database_url or config.database_url or \
+            self.init_config.get_section_option('alembic', 'sqlalchemy.url')
 
     @__database_url__.setter
     def __database_url__(self, db_url):
         """
-        Set sqlalchemy.url in alembic.ini
+        Set sqlalchemy.url in alembic.ini, env.py connects by it
 
         :param db_url: database url
         """
+        self._database_url = db_url
+
+        # percent signs of encoded passwords are interpolated by ConfigParser
         self.init_config.set_section_option(
-            'alembic', 'sqlalchemy.url', db_url
+            'alembic', 'sqlalchemy.url', db_url.replace('%', '%%')
         )
 
+    def __run_env__(self, fn, **kwargs):
+        """
+        Run env.py with cached ScriptDirectory the same way as alembic
+        commands do, so migration files are not loaded again
+
+        :param fn: function of revision and context which returns steps
+        :param kwargs: options of EnvironmentContext
+        """
+        # env.py migrates on connection of wrapper, so history is written in
+        # the same transaction as migrations and no engine is created twice
+        if not kwargs.get('as_sql'):
+            self.init_config.attributes['connection'] = self.conn
+
+        with EnvironmentContext(self.init_config, self.script, fn=fn,
+                                **kwargs):
+            self.script.run_env()
+
     def __get_last_revision__(self):
         """
         Get last revision
@@ -75,7 +277,7 @@ class LowLevelApi:
         :return: revision object ot None if migration does not exist
         """
 
-        revisions = [revision for revision in self.script.walk_revisions()]
+        revisions = [revision for revision in self.index.walk_revisions()]
 
         if revisions:
 
@@ -93,8 +295,7 @@ class LowLevelApi:
 
         :return: current git branch
         """
-        from git import Repo
-        return str(Repo('').active_branch)
+        return current_branch()
 
     def __set_branch_to_script__(self):
         """
@@ -130,14 +331,17 @@ class LowLevelApi:
         """
         Git branch name of specific migration (Revision)
 
-        :param revision: Revision object (migration)
+        :param revision: RevisionHeader or Revision object (migration)
         :return: git branch name
         """
 
-        branch = 'no branch'
+        branch = NO_BRANCH
 
-        if hasattr(revision.module, 'git_branch'):
-            branch = revision.module.git_branch
+        if hasattr(revision, 'git_branch'):
+            branch = revision.git_branch or branch
+        elif hasattr(revision, 'path'):
+            # alembic Script, read header without importing of module
+            branch = read_header(revision.path)['git_branch'] or branch
 
         return branch
 
@@ -147,8 +351,19 @@ class AlembicMigrations(LowLevelApi):
     Class-Wrapper for Alembic that implement some functionality from Alembic
     """
 
-    def __init__(self):
-        super(AlembicMigrations, self).__init__()
+    def __init__(self, database_url=None, script=None):
+        super(AlembicMigrations, self).__init__(database_url, script)
+
+    @staticmethod
+    def __write_gitignore__(path):
+        """
+        Write .gitignore which keeps local caches out of repository
+
+        :param path: path to .gitignore
+        """
+        with open(path, 'w') as gitignore:
+            gitignore.write('# caches of faq_migrations\n')
+            gitignore.write(''.join(name + '\n' for name in LOCAL_CACHES))
 
     @staticmethod
     def init():
@@ -206,6 +421,10 @@ class AlembicMigrations(LowLevelApi):
                     output_file
                 )
 
+        gitignore = os.path.join(config.alembic_dir, '.gitignore')
+        util.status("Generating {}".format(os.path.abspath(gitignore)),
+                    AlembicMigrations.__write_gitignore__, gitignore)
+
         util.msg("Please edit configuration/connection/logging "
                  "settings in {} before proceeding.".format(
             os.path.join(config.alembic_dir, 'alembic.ini'))
@@ -235,8 +454,10 @@ class AlembicMigrations(LowLevelApi):
         if verbose:
             command.heads(self.init_config, verbose=True)
 
-        for head in self.script.get_heads():
-            yield self.get_revision(head)
+        index = self.index
+
+        for head in index.get_heads():
+            yield index.get_revision(head)
 
     def get_revision(self, revision_id):
         """
@@ -260,22 +481,68 @@ class AlembicMigrations(LowLevelApi):
         if len(r_heads) < 2:
             self.__set_branch_to_script__()
             command.revision(self.init_config, name)
+            self.__reset_cache__()
 
         else:
             util.msg('There are {} heads.\n'
                      'You must merge migrations first.'.format(len(r_heads)))
             self.merge()
 
-    def merge(self):
+    def merge_order(self, revision_heads):
+        """
+        Deterministic order of heads for merging: by time of the last commit
+        of their git branch, heads with unknown branch go last
+
+        :param revision_heads: head Revision objects
+        :return: sorted Revision objects
+        """
+        def key(head):
+            commit = commit_time(self.branch_name(head), config.alembic_dir)
+            return commit is None, commit or 0, head.revision
+
+        return sorted(revision_heads, key=key)
+
+    def merge_all(self, revision_heads):
+        """
+        Create one merge revision for all heads
+
+        :param revision_heads: head Revision objects
+        """
+        revision_heads = self.merge_order(revision_heads)
+
+        self.__set_branch_to_script__()
+        command.merge(
+            self.init_config,
+            revisions=[head.revision for head in revision_heads],
+            message='merge_{}'.format('_'.join(
+                '{}({})'.format(head.revision, self.branch_name(head))
+                for head in revision_heads
+            ))
+        )
+        self.__reset_cache__()
+
+    def merge(self, auto=False):
         """
         Perform merging of migrations if exists more then one head
+
+        :param auto: merge all heads by one revision without questions
         """
         revision_heads = [head for head in self.heads]
 
         if len(revision_heads) < 2:
             util.msg('There are not migrations for merge')
+        elif auto:
+            self.merge_all(revision_heads)
         else:
+            util.msg('Recommended: `merge --auto` merges all {} heads in '
+                     'order {}'.format(
+                         len(revision_heads),
+                         ', '.join(head.revision for head in
+                                   self.merge_order(revision_heads))
+                     ))
+
             print('\n\n-------------------------------------------------')
+            graph = self.index.graph
             merge_choices = [choice for choice in
                              self.__merge_choices__(revision_heads)]
             for choice in merge_choices:
@@ -283,11 +550,12 @@ class AlembicMigrations(LowLevelApi):
                 rev_1 = choice['migration1']
                 rev_2 = choice['migration2']
 
-                rev_1_branch = self.__branch_name__(rev_1)
-                rev_2_branch = self.__branch_name__(rev_2)
+                rev_1_branch = self.branch_name(rev_1)
+                rev_2_branch = self.branch_name(rev_2)
 
-                util.msg('{}) {}:{} -> {}:{}'.format(
-                    choice["inc"], rev_1_branch, rev_1, rev_2_branch, rev_2
+                util.msg('{}) {}:{} -> {}:{} (diverged at {})'.format(
+                    choice["inc"], rev_1_branch, rev_1, rev_2_branch, rev_2,
+                    graph.merge_base(rev_1.revision, rev_2.revision)
                 ))
 
             util.msg('-------------------------------------------------\n\n')
@@ -306,6 +574,7 @@ class AlembicMigrations(LowLevelApi):
                 rev_1 = merge_choices[choice - 1]['migration1']
                 rev_2 = merge_choices[choice - 1]['migration2']
 
+                self.__set_branch_to_script__()
                 command.merge(
                     self.init_config,
                     revisions=[rev_2.revision, rev_1.revision],
@@ -313,6 +582,7 @@ class AlembicMigrations(LowLevelApi):
                         rev_1, rev_1.branch_labels, rev_2, rev_2.branch_labels
                     )
                 )
+                self.__reset_cache__()
 
             except ValueError:
                 util.msg('Your choice must be of int data type')
@@ -322,121 +592,639 @@ class AlembicMigrations(LowLevelApi):
         Show migrations
 
         :param limit: limit of output migrations
-        :param upper: sorting. True - new at the top
+        :param upper: sorting of the newest revisions. True - new at the
+        top, False - old at the top
 
         :return: Revision objects
         """
 
-        revisions = list(self.script.walk_revisions())
+        index = self.index
+        order = index.graph.order
 
-        if limit > len(revisions):
-            limit = len(revisions)
+        if limit > len(order):
+            limit = len(order)
+
+        # only the newest revisions are taken from topological order
+        revisions = order[len(order) - limit:]
 
         if upper:
-            return revisions[:limit]
+            revisions = reversed(revisions)
 
-        return revisions[0: limit]
+        return [index.get_revision(revision) for revision in revisions]
 
-    def migrate(self):
+    def migrate(self, transaction_mode=None, batch_size=100):
         """
         Perform upgrading of your database
 
+        :param transaction_mode: `all` - one transaction for all migrations,
+        `per-migration` - transaction per migration, `batch` - transaction
+        per `batch_size` migrations. Layout of env.py is used by default
+        :param batch_size: amount of migrations in transaction of batch mode
         :return: True if OK
         """
+        # This is Monkey-Patch for adding logging into migration process
+        from faq_migrations import patch
+
+        if transaction_mode not in (None, ) + patch.TRANSACTION_MODES:
+            raise util.CommandError(
+                'Unknown transaction mode {}'.format(transaction_mode)
+            )
+
+        if transaction_mode == patch.BATCH and batch_size < 1:
+            raise util.CommandError('Batch size must be positive')
 
         rev_heads = [head for head in self.heads]
 
         if len(rev_heads) > 1:
             return False
 
-        upgrade_migrations = self.upgrade_revisions(rev_heads[0].revision)
+        head = rev_heads[0].revision
 
-        if not len(upgrade_migrations):
+        if not self.upgrade_revisions(head):
             return
 
-        if not self.engine.dialect.has_table(
-                self.engine, VersionHistory.__tablename__):
-            VersionHistory.__table__.create(bind=self.engine)
+        # replicas which start together run migrations one by one, waiters
+        # only poll current revision and don't load migrations
+        lock = MigrationLock(self.engine)
 
-        # This is Monkey-Patch for adding logging into migration process
-        from alembic.runtime import migration
-        from faq_migrations.patch import PatchedHeadMaintainer
+        try:
+            while not lock.acquire():
+                if self.context.get_current_heads() == (head, ):
+                    return
+
+                time.sleep(POLL_INTERVAL)
+
+            # migrations may be done by previous owner of lock
+            if not self.upgrade_revisions(head):
+                return
 
-        migration.HeadMaintainer = PatchedHeadMaintainer
-        command.upgrade(self.init_config, 'head')
+            # table created by previous versions gets new columns, only the
+            # owner of lock alters it
+            ensure_history_table(self.conn)
+
+            patch.install()
+
+            def upgrade(revision, context):
+                return self.script._upgrade_revs('head', revision)
+
+            self.__run_env__(upgrade, starting_rev=None,
+                             destination_rev='head',
+                             transaction_mode=transaction_mode,
+                             batch_size=batch_size)
+        finally:
+            lock.release()
 
         return True
 
-    def upgrade_revisions(self, head):
+    def bootstrap(self):
+        """
+        Create schema of empty database from snapshot of migrated one instead
+        of running of all migrations. Snapshot is captured by the first
+        bootstrap after changes of migration files
+
+        :return: True if OK, False if there are few heads, None if database
+        is already at head
+        """
+        rev_heads = [head for head in self.heads]
+
+        if not rev_heads:
+            util.msg('There are not migrations for bootstrap')
+            return
+
+        if len(rev_heads) > 1:
+            return False
+
+        head = rev_heads[0].revision
+
+        if not self.__is_empty__():
+            # database is not empty, snapshot can't be restored
+            return self.migrate()
+
+        snapshots = SchemaSnapshot(config.alembic_dir)
+        path = snapshots.path(self.engine.dialect.name, head)
+        snapshot = snapshots.load(path)
+
+        if snapshot is None:
+            result = self.migrate()
+            unsupported = snapshots.unsupported(self.conn)
+
+            if unsupported:
+                # restored database would differ from migrated one
+                util.msg('Schema snapshot is not saved, it can\'t restore '
+                         '{}'.format(', '.join(unsupported)))
+            elif snapshots.save(path, snapshots.capture(self.conn)):
+                util.msg('Schema snapshot is saved into {}'.format(path))
+
+            return result
+
+        # replicas which bootstrap one database together restore it once
+        lock = MigrationLock(self.engine)
+
+        try:
+            while not lock.acquire():
+                if self.context.get_current_heads() == (head, ):
+                    return
+
+                time.sleep(POLL_INTERVAL)
+
+            # database may be restored by previous owner of lock
+            restored = not self.__is_empty__()
+
+            if not restored:
+                with self.conn.begin():
+                    snapshots.restore(self.conn, snapshot)
+        finally:
+            lock.release()
+
+        if restored:
+            return self.migrate()
+
+        return True
+
+    def __is_empty__(self):
+        """
+        :return: True if database has no tables except of migrate lock
+        """
+        return not set(self.engine.dialect.get_table_names(self.conn)) - {
+            LOCK_TABLE
+        }
+
+    def migrate_sql(self, revision_range=None, output=None):
+        """
+        Write SQL script of upgrade instead of running it, with statements of
+        alembic_version_history. SQL of every migration is cached by hash of
+        its file, so only changed revisions are rendered again
+
+        :param revision_range: `from:to`, base and head by default
+        :param output: file object, stdout by default
+        """
+        starting_rev, _, destination = (revision_range or '').rpartition(':')
+        starting_rev = starting_rev or None
+        destination = destination or 'head'
+
+        # offline env.py reads dialect only from alembic.ini
+        self.__database_url__ = self.__database_url__
+
+        if output is not None:
+            self.init_config.output_buffer = output
+
+        cache = SqlCache(config.alembic_dir)
+
+        from faq_migrations import patch
+
+        patch.install()
+
+        def upgrade(revision, context):
+            return [
+                cache.wrap(step, context)
+                for step in self.script._upgrade_revs(destination, revision)
+            ]
+
+        self.__run_env__(upgrade, as_sql=True, starting_rev=starting_rev,
+                         destination_rev=destination)
+
+    @classmethod
+    def migrate_targets(cls, database_urls, jobs=4, transaction_mode=None,
+                        batch_size=100):
+        """
+        Upgrade few databases in parallel. Migration files are parsed once
+        and forked worker processes share loaded ScriptDirectory, every
+        worker has its own connection and writes its own history. Where
+        fork is not the default start method, spawned workers parse files
+        once per worker
+
+        :param database_urls: list of database urls
+        :param jobs: size of worker pool
+        :param transaction_mode: see migrate
+        :param batch_size: see migrate
+        :return: list of tuples of url, status and error message
+        """
+        global _shared_script
+
+        session = cls()
+
+        if len(list(session.heads)) > 1:
+            return [(url, FAILED, 'Migrations have more then one head')
+                    for url in database_urls]
+
+        size = max(1, min(jobs, len(database_urls)))
+
+        if multiprocessing.get_start_method() == 'fork':
+            # load revision map before fork, workers get it with process
+            # memory
+            _shared_script = session.script
+            _shared_script.revision_map.heads
+
+            pool = multiprocessing.get_context('fork').Pool(size)
+        else:
+            # fork is not available (Windows) or not safe (macOS), every
+            # spawned worker parses migration files once
+            settings = {name: value for name, value in vars(config).items()
+                        if not name.startswith('_')}
+
+            pool = multiprocessing.get_context('spawn').Pool(
+                size, initializer=_load_script, initargs=(settings, )
+            )
+
+        try:
+            return pool.map(partial(_migrate_target,
+                                    transaction_mode=transaction_mode,
+                                    batch_size=batch_size), database_urls)
+        finally:
+            pool.close()
+            pool.join()
+            _shared_script = None
+
+    def upgrade_revisions(self, head=None):
         """
         Return list of migrations that will be done
 
-        :param head: current head
-        :return: Revision Objects
+        :param head: target revision, all heads by default
+        :return: RevisionHeader Objects in order of applying
         """
-        revisions = self.script.iterate_revisions(head, self.current())
-        return [rev for rev in revisions][::-1]
+        index = self.index
+
+        return [index.get_revision(revision)
+                for revision in index.graph.pending(
+                    self.context.get_current_heads(), head
+                )]
+
+    def iterate_local_revisions(self):
+        """
+        Lazily walk created migrations from base to heads
+        :return: RevisionHeader Objects
+        """
+        index = self.index
+
+        # Skip initial migration with None down_revision
+        for revision in index.graph.order:
+            header = index.get_revision(revision)
+
+            if header.down_revision:
+                yield header
 
     @property
     def all_local_revisions(self):
         """
         List of all created migrations
-        :return: Revision Objects
+        :return: RevisionHeader Objects
         """
-        # Skip initial migration with None down_revision and reverse list
-        revisions = [rev for rev in self.script.walk_revisions()
-                     if rev.down_revision]
-        revisions = revisions[::-1]
-        return revisions
+        return list(self.iterate_local_revisions())
 
     def branch_name(self, revision):
         """
-        Get Git Branch Name from migration file by revision id
+        Get Git Branch Name of migration: git_branch written into the file by
+        `create` or branch of the commit which introduced the file if it has
+        no git_branch
 
-        :param revision: if of revision
+        :param revision: Revision object
         :return: git branch name of specific revision
         """
-        return self.__branch_name__(revision)
+        branch = self.__branch_name__(revision)
 
-    def downgrade(self, amount):
-        from faq_migrations.patch import MigrationStepPatched
-        from alembic.runtime import migration
+        if branch == NO_BRANCH:
+            branch = self.attribution.branch(revision.path) or branch
 
-        migration.MigrationStep = MigrationStepPatched
+        return branch
 
+    def downgrade(self, amount):
         if isinstance(amount, int):
             print('Running downgrade for ', amount, ' migrations')
 
-            migrations = db_session.query(VersionHistory)\
-                .order_by(VersionHistory.id.desc()).limit(amount).all()
+            history = VersionHistory.__table__
 
-            for migration in migrations:
-                command.downgrade(self.init_config, migration.from_ver)
+            ensure_history_table(self.conn)
 
-        elif isinstance(amount, list):
-            for revision in amount:
-                top = db_session.query(VersionHistory).filter(
-                    VersionHistory.to_ver == revision
-                ).first()
+            migrations = self.conn.execute(
+                select([history.c.id, history.c.from_ver, history.c.to_ver])
+                .where(VersionHistory.applied())
+                .order_by(history.c.id.desc()).limit(amount)
+            ).fetchall()
+
+            if not migrations:
+                util.msg('There are not migrations for downgrade')
+                return
+
+            # timings of downgrade steps are written by PatchedHeadMaintainer
+            from faq_migrations import patch
+
+            patch.install()
+
+            # target is known from history, so whole sequence is reverted by
+            # one alembic run on one connection
+            target = VersionHistory.parse_revision(migrations[-1].from_ver)
+            steps = self.script._downgrade_revs(
+                target, self.context.get_current_heads()
+            )
+
+            # branches applied in turns are reverted by alembic together, so
+            # downgrade to target may revert other migrations than last ones
+            reverted = {step.revision.revision for step in steps}
+            requested = {migration.to_ver for migration in migrations}
+
+            if reverted != requested:
+                util.msg(
+                    'Downgrade to {} reverts {}, not the last {} migrations '
+                    '{}. Use downgrade_heads to choose revisions'.format(
+                        target, ', '.join(sorted(reverted)), amount,
+                        ', '.join(sorted(requested))
+                    )
+                )
+                return False
 
-                current_head = db_session.query(VersionNumber).first()
-                current_head.version_num = top.to_ver
-                db_session.commit()
+            def downgrade(revision, context):
+                return steps
 
-                command.downgrade(self.init_config, top.from_ver)
+            # reverted rows are removed in the same transaction as downgrade
+            with self.conn.begin():
+                self.__run_env__(downgrade, starting_rev=None,
+                                 destination_rev=target)
 
-            # revert migration sequence head
-            last_migration = db_session.query(VersionHistory).order_by(
-                VersionHistory.id.desc()
-            ).first()
+                self.conn.execute(history.delete().where(
+                    history.c.id.in_([m.id for m in migrations])
+                ))
 
-            current_head = db_session.query(VersionNumber).first()
-            current_head.version_num = last_migration.to_ver
-            db_session.commit()
+        elif isinstance(amount, list):
+            self.downgrade_heads(amount)
 
         else:
             raise Exception('Invalid parameter type, might be int or list')
 
+    def downgrade_plan(self, revisions):
+        """
+        Plan of downgrade for passed revisions. Applied descendants of them
+        are downgraded too. Revisions are reverted in order opposite to the
+        order of applying, so dependent migrations go first
+
+        :param revisions: list of revision ids
+        :return: rows of alembic_version_history in order of downgrade
+        """
+        history = VersionHistory.__table__
+        graph = self.index.graph
+        columns = history_columns(self.conn)
+
+        unknown = [rev for rev in revisions if rev not in graph]
+
+        if unknown:
+            raise util.CommandError(
+                'Revisions {} not found'.format(', '.join(unknown))
+            )
+
+        requested = 0
+
+        for revision in revisions:
+            requested |= graph.bit(revision)
+
+        applied = graph.mask(self.context.get_current_heads())
+        reverted = graph.revisions(graph.descendants(requested) & applied)
+        dependent = [rev for rev in reverted if rev not in revisions]
+
+        if dependent:
+            util.msg('Applied descendants {} are downgraded too'.format(
+                ', '.join(dependent)
+            ))
+
+        rows = self.conn.execute(
+            select([history.c.id, history.c.from_ver, history.c.to_ver])
+            .where(history.c.to_ver.in_(list(revisions) + dependent))
+            .where(VersionHistory.applied(columns))
+            .order_by(history.c.id.desc())
+        ).fetchall() if columns else []
+
+        plan = OrderedDict()
+
+        for row in rows:
+            plan.setdefault(row.to_ver, row)
+
+        missing = [rev for rev in list(revisions) + dependent
+                   if rev not in plan]
+
+        if missing:
+            raise util.CommandError(
+                'Revisions {} not found in {}'.format(
+                    ', '.join(missing), VersionHistory.__tablename__
+                )
+            )
+
+        return list(plan.values())
+
+    def downgrade_heads(self, revisions, dry_run=False):
+        """
+        Downgrade specific revisions, even if they are not heads. All steps,
+        cleaning of history and fixing of alembic_version are done in one
+        transaction
+
+        :param revisions: list of revision ids
+        :param dry_run: only show plan
+        :return: plan of downgrade
+        """
+        from alembic.operations import Operations
+
+        plan = self.downgrade_plan(revisions)
+
+        for row in plan:
+            util.msg('Downgrade {} -> {}'.format(row.to_ver, row.from_ver))
+
+        if dry_run:
+            return plan
+
+        # timings of downgrade steps need columns of the current version
+        ensure_history_table(self.conn)
+
+        history = VersionHistory.__table__
+        version = VersionNumber.__table__
+        timings = []
+
+        # revisions which stay applied, other branches keep their heads
+        graph = self.index.graph
+        applied = graph.mask(self.context.get_current_heads())
+
+        for row in plan:
+            applied &= ~graph.bit(row.to_ver)
+
+        with self.conn.begin():
+
+            with Operations.context(self.context):
+                for row in plan:
+                    module = self.get_revision(row.to_ver).module
+                    started_at = datetime.utcnow()
+                    clock = time.perf_counter()
+
+                    module.downgrade()
+
+                    timings.append(dict(
+                        from_ver=row.from_ver,
+                        to_ver=row.to_ver,
+                        started_at=started_at,
+                        duration=time.perf_counter() - clock,
+                        direction=DOWNGRADE,
+                        git_branch=getattr(module, 'git_branch', None)
+                    ))
+
+            self.conn.execute(history.delete().where(
+                history.c.id.in_([row.id for row in plan])
+            ))
+            self.conn.execute(history.insert(), timings)
+
+            # revert migration sequence heads
+            heads = graph.heads(applied)
+
+            self.conn.execute(version.delete())
+
+            if heads:
+                self.conn.execute(version.insert(), [
+                    dict(version_num=head) for head in heads
+                ])
+
+        return plan
+
+    def timings(self, database_urls=None, limit=20):
+        """
+        Aggregate durations of migration steps across databases
+
+        :param database_urls: databases of environments, current by default
+        :param limit: amount of the slowest steps
+        :return: list of dicts sorted by the longest duration
+        """
+        history = VersionHistory.__table__
+        query = select([
+            history.c.to_ver, history.c.direction,
+            func.count(history.c.id), func.sum(history.c.duration),
+            func.max(history.c.duration)
+        ]).where(history.c.duration.isnot(None))\
+            .group_by(history.c.to_ver, history.c.direction)
+
+        stats = {}
+
+        for database_url in database_urls or [self.__database_url__]:
+            with get_engine(database_url).connect() as conn:
+                # databases which are not migrated by this version have no
+                # timings, they are not altered by read command
+                if 'duration' not in history_columns(conn):
+                    continue
+
+                for to_ver, direction, count, total, longest in \
+                        conn.execute(query):
+
+                    step = stats.setdefault((to_ver, direction), dict(
+                        revision=to_ver, direction=direction, count=0,
+                        total=0.0, max=0.0
+                    ))
+                    step['count'] += count
+                    step['total'] += total
+                    step['max'] = max(step['max'], longest)
+
+        return sorted(
+            stats.values(), key=lambda step: step['max'], reverse=True
+        )[:limit]
+
+    def squash(self, revision):
+        """
+        Replace revision and all of its ancestors by one baseline migration
+        generated from schema of database which is at this revision.
+        Baseline keeps id of revision, so its children are not changed.
+        Replaced files are moved into `squashed/<revision>` directory.
+        Migrations based on other replaced revisions would run against
+        another schema, so squash is refused for them. It is refused for
+        schema objects which baseline can't create and for rows of tables
+
+        :param revision: revision id
+        :return: path to baseline migration
+        """
+        index = self.index
+        graph = index.graph
+
+        if revision not in graph:
+            raise util.CommandError('Revision {} not found'.format(revision))
+
+        current = self.current()
+
+        if current != revision:
+            raise util.CommandError(
+                'Database must be at revision {} to build baseline from its '
+                'schema, current revision is {}'.format(revision, current)
+            )
+
+        replaced = [index.get_revision(rev)
+                    for rev in graph.revisions(graph.mask(revision))]
+
+        if len(replaced) < 2:
+            raise util.CommandError('There are not migrations for squash')
+
+        replaced_ids = {header.revision for header in replaced}
+        forked = sorted(
+            header.revision for header in index.revisions.values()
+            if header.revision not in replaced_ids and
+            replaced_ids.difference([revision]).intersection(
+                header.down_revisions
+            )
+        )
+
+        if forked:
+            raise util.CommandError(
+                'Revisions {} are based on revisions squashed into {}, '
+                'squash their fork point or merge point instead'.format(
+                    ', '.join(forked), revision
+                )
+            )
+
+        squashed = []
+        branch_labels = set()
+
+        for header in replaced:
+            branch_labels.update(to_tuple(header.branch_labels))
+
+            if header.squashed:
+                # baseline of previous squash
+                squashed.extend(header.squashed)
+            elif header.down_revision:
+                squashed.append((
+                    header.revision,
+                    VersionHistory.format_revision(header.down_revision)
+                ))
+
+        metadata = MetaData()
+        metadata.reflect(bind=self.conn)
+
+        # baseline creates only tables and indexes, like schema snapshot
+        unsupported = SchemaSnapshot.unsupported(self.conn) + [
+            'rows of table {}'.format(table.name)
+            for table in baseline_tables(metadata, self.context)
+            if self.conn.scalar(select([literal(1)]).select_from(table)
+                                .limit(1))
+        ]
+
+        if unsupported:
+            raise util.CommandError(
+                'Baseline can\'t create {}, squash of {} is refused'.format(
+                    ', '.join(unsupported), revision
+                )
+            )
+
+        source = render_baseline(
+            metadata, self.context,
+            'squash of {} revisions up to {}'.format(len(replaced), revision),
+            revision, squashed,
+            tuple(sorted(branch_labels)) or None, self.__get_git_branch__()
+        )
+
+        archive_dir = archive([header.path for header in replaced],
+                              config.alembic_dir, revision)
+
+        path = os.path.join(index.versions_dir, '{}_baseline.py'.format(
+            revision
+        ))
+
+        with open(path, 'w') as baseline:
+            baseline.write(source)
+
+        self.__reset_cache__()
+
+        util.msg('{} revisions are squashed into {}, originals are moved into '
+                 '{}'.format(len(replaced), path, archive_dir))
+
+        return path
+
 
 class CompareLocalRemote:
     """
@@ -447,68 +1235,157 @@ class CompareLocalRemote:
     def __init__(self):
         self.session = AlembicMigrations()
 
-    @staticmethod
-    def __get_all_revisions__():
-        revisions = db_session.query(VersionHistory) \
-            .order_by(VersionHistory.id.asc()) \
-            .all()
-        return list(revisions)
-
-    def export_history(self):
-        import pickle
-
-        pickle.dump(
-            self.__get_all_revisions__(),
-            open('migration_history.bin', 'wb')
-        )
+    def export_history(self, file_name='migration_history.bin'):
+        """
+        Stream alembic_version_history into binary file
+
+        :param file_name: name of output file
+        """
+        with open(file_name, 'wb') as history_file:
+            count = write_history(
+                self.__iterate_remote_history__(), history_file
+            )
+
+        util.msg('{} migrations exported into {}'.format(count, file_name))
+
+    def __iterate_remote_history__(self):
+        """
+        Stream rows of alembic_version_history with server-side cursor
+
+        :return: rows with from_ver and to_ver
+        """
+        history = VersionHistory.__table__
+        columns = history_columns(self.session.conn)
+
+        if not columns:
+            return
+
+        result = self.session.conn.execution_options(stream_results=True)\
+            .execute(select([history.c.from_ver, history.c.to_ver])
+                     .where(VersionHistory.applied(columns))
+                     .order_by(history.c.id.asc()))
+
+        for row in result:
+            yield row
 
     def compare_history(self, from_bin_file=None):
         """
-        Compare local migrations sequence and remote at the database. Raise
-        Exception if local and remote sequence are not same.
+        Compare local migrations sequence and remote at the database. Remote
+        sequence must be a valid order of applying of local migrations:
+        every row matches parents of local migration, which were applied
+        before. Every divergence is reported, Exception is raised at the end
+        if local and remote sequence are not same.
 
         :param from_bin_file: BytesObject
         """
-        engine = self.session.engine
+        if not from_bin_file:
+            engine = self.session.engine
 
-        if not engine.dialect.has_table(engine, VersionHistory.__tablename__):
-            raise Exception('Table `alembic_version_history` does not exists,'
-                            ' please migrate your db first')
+            if not engine.dialect.has_table(engine,
+                                            VersionHistory.__tablename__):
+                raise Exception('Table `alembic_version_history` does not '
+                                'exists, please migrate your db first')
 
-        if not from_bin_file:
-            remote_history = db_session.query(VersionHistory) \
-                .order_by(VersionHistory.id.asc()) \
-                .all()
+            remote_history = self.__iterate_remote_history__()
+        elif is_history_file(from_bin_file):
+            remote_history = read_history(from_bin_file)
         else:
+            # file exported by previous versions
             import pickle
 
             remote_history = pickle.load(from_bin_file)
 
-        local_history = self.session.all_local_revisions
+        local_revisions = self.session.index.revisions
+        graph = self.session.index.graph
+        applied = 0
+        divergences = 0
+
+        # revisions replaced by baselines are compared with their headers
+        squashed = {}
+        applied_squashed = set()
+
+        for header in local_revisions.values():
+            squashed.update(header.squashed)
+
+        def report(index, remote, message):
+            print('{}| remote <{}> : {}'.format(index, remote, message))
 
         for index, remote_revision in enumerate(remote_history):
-            print('{}| remote <{}> : local {}'.format(
-                index, remote_revision, local_history[index].revision
-            ))
+            remote = '{} -> {}'.format(
+                remote_revision.from_ver, remote_revision.to_ver
+            )
+            if remote_revision.to_ver in squashed:
+                down_revision = squashed[remote_revision.to_ver]
+
+                if str(remote_revision.from_ver) != down_revision:
+                    divergences += 1
+                    report(index, remote, 'Down revision of squashed '
+                                          'revision is incorrect: remote '
+                                          '`{}` != local `{}`'.format(
+                                              remote_revision.from_ver,
+                                              down_revision
+                                          ))
+
+                elif remote_revision.to_ver in applied_squashed:
+                    divergences += 1
+                    report(index, remote, 'applied twice')
+
+                applied_squashed.add(remote_revision.to_ver)
+
+                if remote_revision.to_ver in graph:
+                    applied |= graph.bit(remote_revision.to_ver)
+
+                continue
+
+            local_revision = local_revisions.get(remote_revision.to_ver)
+
+            if local_revision is None:
+                divergences += 1
+                report(index, remote, 'local migration not found')
+                continue
+
+            down_revision = VersionHistory.format_revision(
+                local_revision.down_revision
+            )
+
+            revision_bit = graph.bit(local_revision.revision)
+
+            # initial migrations are not written into history
+            written = applied | graph.bases
+            not_applied = [
+                rev for rev in local_revision.down_revisions
+                if rev in graph and not graph.bit(rev) & written
+            ]
+
+            if str(remote_revision.from_ver) != down_revision:
+                divergences += 1
+                report(index, remote, 'Down revision is incorrect: remote '
+                                      '`{}` != local `{}`'.format(
+                                          remote_revision.from_ver,
+                                          down_revision
+                                      ))
+
+            elif applied & revision_bit:
+                divergences += 1
+                report(index, remote, 'applied twice')
+
+            elif not_applied:
+                divergences += 1
+                report(index, remote, 'applied before `{}`'.format(
+                    ', '.join(not_applied)
+                ))
 
-            # # First revision doesn't have down_revision, check only
-            # forward rev
-            #
-            # if not index and not local_history[index].down_revision:
-            #     if local_history[index].revision == remote_revision.to_ver:
-            #         continue
+            applied |= revision_bit
 
-            if str(remote_revision.from_ver) != \
-                    str(local_history[index].down_revision):
-                previous = remote_revision.from_ver
-                down_revision = local_history[index].down_revision
+        # remote history is a valid order of applying of local migrations,
+        # the rest of local migrations are not applied yet
+        pending = len(graph.revisions(graph.all & ~(applied | graph.bases)))
 
-                if type(down_revision) in (list, tuple):
-                    down_revision = str(down_revision)
+        if pending:
+            util.msg('{} local migrations are not applied'.format(pending))
 
-                raise Exception('Down revision is incorrect: remote `{}` != '
-                                'local `{}`'.format(previous, down_revision))
+        if divergences:
+            raise Exception('Local and remote sequences have {} '
+                            'divergences'.format(divergences))
 
-            if str(remote_revision.to_ver) != \
-                    str(local_history[index].revision):
-                raise Exception('Forward revision is incorrect')
+        util.msg('Local and remote sequences are same')
@@ -0,0 +1,39 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+# files are created with the same permissions as by open()
+_umask = os.umask(0)
+os.umask(_umask)
+
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    """
+    File which replaces path only when it is completely written. Name of
+    temporary file is unique, so concurrent writers don't clash and the
+    last one wins
+
+    :param path: path to target file
+    :param mode: 'w' or 'wb'
+    :return: opened temporary file
+    """
+    directory, name = os.path.split(path)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory or '.',
+                                    prefix='.{}.'.format(name), suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, mode) as tmp_file:
+            yield tmp_file
+
+        os.chmod(tmp_path, 0o666 & ~_umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+        raise
@@ -0,0 +1,269 @@
+import codecs
+import json
+import os
+import re
+import subprocess
+
+from faq_migrations.source.atomic_file import atomic_write
+
+
+ATTRIBUTION_FILE = '.git_attribution.json'
+ATTRIBUTION_VERSION = 2
+
+REF_PREFIXES = ('refs/heads/', 'refs/remotes/')
+
+# branches whose first-parent history is claimed before other branches
+MAINLINE_BRANCHES = ('main', 'master')
+
+# subjects of merge commits of git, GitHub and GitLab
+MERGE_SUBJECT = re.compile(
+    r"^Merge (?:branch '(?P<branch>[^']+)'"
+    r"|remote-tracking branch '[^'/]+/(?P<remote>[^']+)'"
+    r"|pull request #\d+ from [^/\s]+/(?P<pull>\S+))"
+)
+
+
+def short_ref(ref):
+    """
+    Branch name of ref reported by `git for-each-ref`
+    """
+    for prefix in REF_PREFIXES:
+        if ref.startswith(prefix):
+            ref = ref[len(prefix):]
+
+            if prefix == 'refs/remotes/':
+                # strip name of remote
+                ref = ref.partition('/')[2]
+
+            return ref
+
+    return ref
+
+
+def unquote_path(path):
+    """
+    Path printed by git, names with special or non-ASCII characters are
+    quoted as C string when core.quotePath is on
+    """
+    if not path.startswith('"'):
+        return path
+
+    return codecs.escape_decode(path[1:-1].encode('utf-8'))[0]\
+        .decode('utf-8')
+
+
+def merged_branch(subject):
+    """
+    Name of branch merged by merge commit
+
+    :param subject: subject of merge commit
+    :return: branch name or None if subject is not generated by git
+    """
+    match = MERGE_SUBJECT.match(subject)
+
+    if match is None:
+        return None
+
+    return match.group('branch') or match.group('remote') or \
+        match.group('pull')
+
+
+def label_commits(commits, branches):
+    """
+    Branch of every commit. Commit belongs to the first branch whose
+    first-parent history contains it, mainline branches are the first.
+    Commits which are merged from removed branches get the branch from
+    subject of merge commit, or the branch of merge commit if subject is
+    custom
+
+    :param commits: dict of commit to list of parents and subject
+    :param branches: list of branch names and tips in order of priority
+    :return: dict of commit to branch name
+    """
+    labels = {}
+    merges = []
+
+    def claim(commit, branch):
+        while commit in commits and commit not in labels:
+            labels[commit] = branch
+            parents, _ = commits[commit]
+
+            if len(parents) > 1:
+                merges.append(commit)
+
+            commit = parents[0] if parents else None
+
+    for branch, tip in branches:
+        claim(tip, branch)
+
+    while merges:
+        merge = merges.pop()
+        parents, subject = commits[merge]
+        branch = merged_branch(subject) or labels[merge]
+
+        for parent in parents[1:]:
+            claim(parent, branch)
+
+    return labels
+
+
+class GitAttribution:
+    """
+    Map of migration files to commit and branch which introduced them. It is
+    built by one `git log --name-status` pass over versions directory and
+    updated incrementally: only commits which are not reachable from
+    previously seen branch tips are read. Branches are taken from
+    first-parent history of branches and subjects of merge commits, since
+    the ref which reaches a commit first says nothing about its branch
+    """
+
+    def __init__(self, alembic_dir):
+        self.alembic_dir = alembic_dir
+        self.versions_dir = os.path.abspath(
+            os.path.join(alembic_dir, 'versions')
+        )
+        self.attribution_path = os.path.join(alembic_dir, ATTRIBUTION_FILE)
+        self.files = {}
+
+    def __git__(self, *args):
+        return subprocess.check_output(
+            ('git', ) + args, cwd=self.versions_dir, stderr=subprocess.DEVNULL
+        ).decode('utf-8')
+
+    def __read__(self):
+        try:
+            with open(self.attribution_path) as attribution_file:
+                data = json.load(attribution_file)
+        except (IOError, ValueError):
+            return [], {}
+
+        if data.get('version') != ATTRIBUTION_VERSION:
+            return [], {}
+
+        return data.get('tips', []), data.get('files', {})
+
+    def __write__(self, tips, files):
+        try:
+            with atomic_write(self.attribution_path) as attribution_file:
+                json.dump(dict(version=ATTRIBUTION_VERSION, tips=tips,
+                               files=files),
+                          attribution_file, indent=1, sort_keys=True)
+        except OSError:
+            # attribution is read from git again by the next run
+            pass
+
+    def __log__(self, known_tips):
+        """
+        Read commits which add files into versions directory
+
+        :param known_tips: commits which were already read
+        :return: dict of file name to commit and time
+        """
+        args = ['log', '--all', '--diff-filter=A', '--name-status',
+                '--format=%x00%H%x09%ct']
+
+        if known_tips:
+            args += ['--not'] + known_tips
+
+        output = self.__git__(*(args + ['--', self.versions_dir]))
+        files = {}
+
+        for chunk in output.split('\x00')[1:]:
+            lines = chunk.strip().splitlines()
+            commit, time = lines[0].split('\t')
+
+            for line in lines[1:]:
+                status, _, path = line.partition('\t')
+                path = unquote_path(path)
+
+                if status != 'A' or not path.endswith('.py'):
+                    continue
+
+                # log goes from new commits to old ones, the oldest wins
+                files[os.path.basename(path)] = dict(
+                    commit=commit, time=int(time)
+                )
+
+        return files
+
+    def __branches__(self):
+        """
+        Branches of commits of the whole repository
+
+        :return: dict of commit to branch name
+        """
+        commits = {}
+
+        for line in self.__git__(
+            'log', '--all', '--format=%H%x09%P%x09%s'
+        ).splitlines():
+            commit, parents, subject = line.split('\t', 2)
+            commits[commit] = parents.split(), subject
+
+        branches = {}
+
+        # local branches win over remote ones of the same name
+        for line in reversed(self.__git__(
+            'for-each-ref', '--format=%(objectname)%09%(refname)',
+            'refs/heads', 'refs/remotes'
+        ).splitlines()):
+            tip, ref = line.split('\t')
+
+            if not ref.endswith('/HEAD'):
+                branches[short_ref(ref)] = tip
+
+        return label_commits(commits, sorted(
+            branches.items(),
+            key=lambda branch: (branch[0] not in MAINLINE_BRANCHES, branch)
+        ))
+
+    def load(self):
+        """
+        Refresh attribution for new commits
+
+        :return: self
+        """
+        known_tips, files = self.__read__()
+
+        try:
+            tips = sorted(set(self.__git__(
+                'for-each-ref', '--format=%(objectname)'
+            ).split()))
+        except (OSError, subprocess.CalledProcessError):
+            # not a git repository
+            self.files = files
+            return self
+
+        if tips == known_tips:
+            self.files = files
+            return self
+
+        try:
+            new_files = self.__log__(known_tips)
+        except subprocess.CalledProcessError:
+            # some of known tips were removed from repository (rebase)
+            files, new_files = {}, self.__log__([])
+
+        for name, attribution in new_files.items():
+            if name not in files or attribution['time'] < files[name]['time']:
+                files[name] = attribution
+
+        # new branches and merges change branches of old commits too
+        branches = self.__branches__()
+
+        for attribution in files.values():
+            attribution['branch'] = branches.get(attribution['commit'])
+
+        self.__write__(tips, files)
+        self.files = files
+        return self
+
+    def branch(self, path):
+        """
+        Branch which introduced migration file
+
+        :param path: path to migration file
+        :return: branch name or None if file is not committed yet
+        """
+        attribution = self.files.get(os.path.basename(path))
+        return attribution.get('branch') if attribution else None
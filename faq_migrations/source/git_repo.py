@@ -0,0 +1,235 @@
+import os
+import re
+import subprocess
+from functools import lru_cache
+
+
+HEADS = 'refs/heads/'
+REMOTES = 'refs/remotes/'
+
+# abbreviated sha of detached HEAD, see current_branch
+_sha = re.compile(r'[0-9a-f]{7,40}$')
+
+
+def find_git_dir(path='.'):
+    """
+    Find git directory of repository which contains path. Worktrees have
+    `.git` file that points to their own git directory, and `commondir`
+    file that points to directory with shared refs
+
+    :param path: any path inside repository
+    :return: tuple of git directory and common directory or None
+    """
+    path = os.path.abspath(path)
+
+    while True:
+        dot_git = os.path.join(path, '.git')
+
+        if os.path.isdir(dot_git):
+            return dot_git, dot_git
+
+        if os.path.isfile(dot_git):
+            with open(dot_git) as git_file:
+                content = git_file.read().strip()
+
+            if not content.startswith('gitdir:'):
+                return None
+
+            git_dir = os.path.normpath(os.path.join(
+                path, content[len('gitdir:'):].strip()
+            ))
+            common_dir = git_dir
+            common_file = os.path.join(git_dir, 'commondir')
+
+            if os.path.isfile(common_file):
+                with open(common_file) as common:
+                    common_dir = os.path.normpath(
+                        os.path.join(git_dir, common.read().strip())
+                    )
+
+            return git_dir, common_dir
+
+        parent = os.path.dirname(path)
+
+        if parent == path:
+            return None
+
+        path = parent
+
+
+def iterate_refs(common_dir, prefix):
+    """
+    Iterate loose and packed refs
+
+    :param common_dir: git directory with shared refs
+    :param prefix: refs/heads/ or refs/remotes/
+    :return: tuples of ref name and sha
+    """
+    refs = {}
+    packed_refs = os.path.join(common_dir, 'packed-refs')
+
+    if os.path.isfile(packed_refs):
+        with open(packed_refs) as packed:
+            for line in packed:
+                if line.startswith(('#', '^')):
+                    continue
+
+                sha, _, name = line.strip().partition(' ')
+
+                if name.startswith(prefix):
+                    refs[name] = sha
+
+    # loose refs have priority over packed ones
+    refs_dir = os.path.join(common_dir, prefix)
+
+    for root, _, files in os.walk(refs_dir):
+        for file_name in files:
+            ref_path = os.path.join(root, file_name)
+            name = os.path.relpath(ref_path, common_dir).replace(os.sep, '/')
+
+            with open(ref_path) as ref:
+                refs[name] = ref.read().strip()
+
+    return refs.items()
+
+
+def read_head(path='.'):
+    """
+    Read HEAD of repository without GitPython
+
+    :param path: any path inside repository
+    :return: branch name, sha of detached HEAD or None
+    """
+    dirs = find_git_dir(path)
+
+    if dirs is None:
+        return None
+
+    git_dir, common_dir = dirs
+
+    with open(os.path.join(git_dir, 'HEAD')) as head_file:
+        head = head_file.read().strip()
+
+    if head.startswith('ref: '):
+        ref = head[len('ref: '):]
+        return ref[len(HEADS):] if ref.startswith(HEADS) else ref
+
+    # detached HEAD (CI checkouts), look for branch on the same commit
+    for prefix in (HEADS, REMOTES):
+        for name, sha in sorted(iterate_refs(common_dir, prefix)):
+            if sha == head and not name.endswith('/HEAD'):
+                name = name[len(prefix):]
+
+                if prefix == REMOTES:
+                    # strip name of remote
+                    name = name.partition('/')[2]
+
+                return name
+
+    return head[:12]
+
+
+def read_head_file(path='.'):
+    """
+    Content of HEAD file, it is changed by every checkout
+
+    :param path: any path inside repository
+    :return: string or None if repository can't be recognized
+    """
+    dirs = find_git_dir(path)
+
+    if dirs is None:
+        return None
+
+    with open(os.path.join(dirs[0], 'HEAD')) as head_file:
+        return head_file.read().strip()
+
+
+def current_branch(path='.'):
+    """
+    Get current git branch. Git directory is read directly and GitPython is
+    used only for repositories which can't be recognized that way. Branch is
+    cached by content of HEAD, so checkout in the same process is noticed
+
+    :param path: any path inside repository
+    :return: branch name or sha of commit
+    """
+    return _current_branch(path, read_head_file(path))
+
+
+@lru_cache(maxsize=None)
+def _current_branch(path, head):
+    branch = read_head(path)
+
+    if branch is not None:
+        return branch
+
+    from git import Repo
+
+    repo = Repo(path, search_parent_directories=True)
+
+    try:
+        return str(repo.active_branch)
+    except TypeError:
+        # detached HEAD
+        return repo.head.commit.hexsha[:12]
+
+
+def is_branch_name(name, path='.'):
+    """
+    Check name by `git check-ref-format`, names which look like options are
+    refused too
+
+    :param name: branch name
+    :param path: any path inside repository
+    :return: True if name is valid branch name
+    """
+    if not name or name.startswith('-'):
+        return False
+
+    try:
+        subprocess.check_call(['git', 'check-ref-format', HEADS + name],
+                              cwd=path, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return False
+
+    return True
+
+
+@lru_cache(maxsize=None)
+def commit_time(ref, path='.'):
+    """
+    Time of the last commit of branch. Ref is read from migration files, so
+    it is passed to git only as qualified ref of valid branch name or as sha
+
+    :param ref: name of local or remote branch or sha of commit
+    :param path: any path inside repository
+    :return: unix timestamp or None if ref is unknown
+    """
+    commit = None
+
+    if is_branch_name(ref, path):
+        commit = _git_time(path, 'for-each-ref', '--count=1',
+                           '--sort=-committerdate',
+                           '--format=%(committerdate:raw)', HEADS + ref,
+                           REMOTES + '*/' + ref)
+
+    if commit is None and _sha.match(ref):
+        commit = _git_time(path, 'log', '-1', '--format=%ct', ref, '--')
+
+    return commit
+
+
+def _git_time(path, *args):
+    """
+    :return: the first number of git output or None if git failed
+    """
+    try:
+        output = subprocess.check_output(
+            ('git', ) + args, cwd=path, stderr=subprocess.DEVNULL
+        ).split()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return int(output[0]) if output else None
@@ -0,0 +1,84 @@
+import ast
+import os
+
+from alembic.util import load_python_file
+
+
+HEADER_FIELDS = ('revision', 'down_revision', 'branch_labels', 'depends_on',
+                 'git_branch', 'squashed')
+
+
+class HeaderError(ValueError):
+    """
+    Header of migration file can't be read statically
+    """
+
+
+def parse_header(source, filename='<migration>'):
+    """
+    Read header of migration from its source without executing it.
+    Only top-level assignments of literals are taken into account
+
+    :param source: source code of migration (str or bytes)
+    :param filename: file name for error messages
+    :return: dict with header attributes and docstring
+    """
+    try:
+        tree = ast.parse(source, filename)
+    except SyntaxError as e:
+        raise HeaderError('Can not parse {}: {}'.format(filename, e))
+
+    header = dict.fromkeys(HEADER_FIELDS)
+    header['doc'] = ast.get_docstring(tree, clean=False)
+
+    for node in tree.body:
+        if not isinstance(node, ast.Assign):
+            continue
+
+        for target in node.targets:
+            if not isinstance(target, ast.Name) or \
+                    target.id not in HEADER_FIELDS:
+                continue
+
+            try:
+                header[target.id] = ast.literal_eval(node.value)
+            except ValueError:
+                raise HeaderError('`{}` in {} is not a literal'.format(
+                    target.id, filename
+                ))
+
+    if not header['revision']:
+        raise HeaderError('Revision not found in {}'.format(filename))
+
+    return header
+
+
+def import_header(path):
+    """
+    Read header of migration file by importing it. Used only when header
+    can't be parsed statically
+
+    :param path: path to migration file
+    :return: dict with header attributes and docstring
+    """
+    module = load_python_file(*os.path.split(path))
+
+    header = {field: getattr(module, field, None) for field in HEADER_FIELDS}
+    header['doc'] = module.__doc__
+    return header
+
+
+def read_header(path):
+    """
+    Read header of migration file
+
+    :param path: path to migration file
+    :return: dict with header attributes and docstring
+    """
+    with open(path, 'rb') as migration:
+        source = migration.read()
+
+    try:
+        return parse_header(source, path)
+    except HeaderError:
+        return import_header(path)
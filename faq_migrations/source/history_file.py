@@ -0,0 +1,101 @@
+import mmap
+import os
+import struct
+from collections import namedtuple
+
+
+MAGIC = b'FAQH'
+FORMAT_VERSION = 1
+
+_header = struct.Struct('<4sB')
+_lengths = struct.Struct('<HH')
+
+HistoryRecord = namedtuple('HistoryRecord', ('from_ver', 'to_ver'))
+
+
+def write_history(rows, history_file):
+    """
+    Write rows of alembic_version_history into binary file one by one. Every
+    record is two length-prefixed utf-8 strings: from_ver and to_ver
+
+    :param rows: iterable of rows with from_ver and to_ver
+    :param history_file: file object opened in binary mode
+    :return: amount of written records
+    """
+    history_file.write(_header.pack(MAGIC, FORMAT_VERSION))
+    count = 0
+
+    for row in rows:
+        from_ver = row.from_ver.encode('utf-8')
+        to_ver = row.to_ver.encode('utf-8')
+
+        history_file.write(_lengths.pack(len(from_ver), len(to_ver)))
+        history_file.write(from_ver)
+        history_file.write(to_ver)
+        count += 1
+
+    return count
+
+
+def read_history(history_file):
+    """
+    Read records of binary history file through mmap without loading of whole
+    file into memory
+
+    :param history_file: file object opened in binary mode
+    :return: HistoryRecord objects
+    """
+    if not os.fstat(history_file.fileno()).st_size:
+        raise ValueError('History file is empty')
+
+    with mmap.mmap(history_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+        size = len(data)
+
+        if size < _header.size:
+            raise ValueError('File is not a migration history')
+
+        magic, version = _header.unpack_from(data, 0)
+
+        if magic != MAGIC:
+            raise ValueError('File is not a migration history')
+
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported history format version {}'.format(version)
+            )
+
+        offset = _header.size
+
+        while offset < size:
+            if offset + _lengths.size > size:
+                raise ValueError('History file is truncated')
+
+            from_length, to_length = _lengths.unpack_from(data, offset)
+            offset += _lengths.size
+
+            if offset + from_length + to_length > size:
+                raise ValueError('History file is truncated')
+
+            from_ver = data[offset:offset + from_length].decode('utf-8')
+            offset += from_length
+
+            to_ver = data[offset:offset + to_length].decode('utf-8')
+            offset += to_length
+
+            yield HistoryRecord(from_ver, to_ver)
+
+
+def is_history_file(history_file):
+    """
+    Check magic bytes of file, files exported by previous versions are
+    pickled lists of VersionHistory
+
+    :param history_file: file object opened in binary mode
+    :return: True if file has binary history format
+    """
+    position = history_file.tell()
+    magic = history_file.read(len(MAGIC))
+    history_file.seek(position)
+
+    return magic == MAGIC
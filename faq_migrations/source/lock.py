@@ -0,0 +1,169 @@
+import os
+import socket
+import threading
+import uuid
+import zlib
+from datetime import timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, \
+    func, select
+from sqlalchemy.exc import DBAPIError, IntegrityError, OperationalError
+
+
+LOCK_TABLE = 'alembic_version_lock'
+
+# key of advisory lock, the same for all processes of the project
+ADVISORY_LOCK_ID = zlib.crc32(b'faq_migrations.migrate')
+
+# waiters check database every POLL_INTERVAL seconds, lock row which is
+# older than STALE_TIMEOUT seconds belongs to died process, living owner
+# refreshes it four times per STALE_TIMEOUT
+POLL_INTERVAL = 1.0
+STALE_TIMEOUT = 600
+
+# errors of MySQL lock wait timeout and deadlock
+MYSQL_LOCK_ERRORS = (1205, 1213)
+
+lock_table = Table(
+    LOCK_TABLE, MetaData(),
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('owner', String, nullable=False),
+    Column('locked_at', DateTime, nullable=False),
+)
+
+
+def is_lock_conflict(error, dialect):
+    """
+    Error raised because lock row or table is held by other process
+
+    :param error: DBAPIError
+    :param dialect: name of SQLAlchemy dialect
+    :return: True if lock is simply not available
+    """
+    if isinstance(error, IntegrityError):
+        return True
+
+    if dialect == 'sqlite':
+        return 'database is locked' in str(error.orig)
+
+    if dialect == 'mysql':
+        args = getattr(error.orig, 'args', ())
+        return bool(args) and args[0] in MYSQL_LOCK_ERRORS
+
+    return False
+
+
+class MigrationLock:
+    """
+    Database-level lock of migrate. Postgres advisory lock is released by
+    server when connection of owner is lost, other dialects use row of
+    alembic_version_lock table which is taken over when it is stale
+    """
+
+    def __init__(self, engine, stale_timeout=STALE_TIMEOUT,
+                 refresh_interval=None):
+        self.engine = engine
+        self.stale_timeout = stale_timeout
+        self.refresh_interval = refresh_interval or stale_timeout / 4
+        self.owner = '{}:{}:{}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )
+        self.connection = None
+        self.acquired = False
+        self._stop = threading.Event()
+        self._refresher = None
+
+    @property
+    def is_advisory(self):
+        return self.engine.dialect.name == 'postgresql'
+
+    def acquire(self):
+        """
+        Try to take lock without waiting
+
+        :return: True if lock is taken
+        """
+        if self.connection is None:
+            self.connection = self.engine.connect()
+
+        if self.is_advisory:
+            self.acquired = bool(self.connection.scalar(
+                select([func.pg_try_advisory_lock(ADVISORY_LOCK_ID)])
+            ))
+            return self.acquired
+
+        try:
+            lock_table.create(self.connection, checkfirst=True)
+        except DBAPIError:
+            # table is created by other process at the same moment
+            if not self.engine.dialect.has_table(self.connection, LOCK_TABLE):
+                raise
+
+        try:
+            with self.connection.begin():
+                # clock of database is the same for all hosts
+                now = self.connection.scalar(select([func.now()]))
+
+                self.connection.execute(lock_table.delete().where(
+                    lock_table.c.locked_at <
+                    now - timedelta(seconds=self.stale_timeout)
+                ))
+                self.connection.execute(lock_table.insert().values(
+                    id=1, owner=self.owner, locked_at=func.now()
+                ))
+        except (IntegrityError, OperationalError) as e:
+            # row of other process, or database is locked by its insert
+            if is_lock_conflict(e, self.engine.dialect.name):
+                return False
+
+            raise
+
+        self.acquired = True
+
+        self._stop.clear()
+        self._refresher = threading.Thread(target=self.__refresh__,
+                                           daemon=True)
+        self._refresher.start()
+
+        return True
+
+    def __refresh__(self):
+        """
+        Keep lock row fresh while owner migrates, so it isn't taken over as
+        stale by waiters. Thread uses its own connection
+        """
+        with self.engine.connect() as connection:
+            while not self._stop.wait(self.refresh_interval):
+                try:
+                    connection.execute(lock_table.update().where(
+                        lock_table.c.owner == self.owner
+                    ).values(locked_at=func.now()))
+                except DBAPIError:
+                    # database is busy with migrations, try it next time
+                    pass
+
+    def release(self):
+        """
+        Release lock if it was taken and close connection of lock
+        """
+        if self._refresher is not None:
+            self._stop.set()
+            self._refresher.join()
+            self._refresher = None
+
+        if self.connection is None:
+            return
+
+        try:
+            if self.acquired and self.is_advisory:
+                self.connection.scalar(
+                    select([func.pg_advisory_unlock(ADVISORY_LOCK_ID)])
+                )
+            elif self.acquired:
+                self.connection.execute(lock_table.delete().where(
+                    lock_table.c.owner == self.owner
+                ))
+        finally:
+            self.connection.close()
+            self.connection = None
+            self.acquired = False
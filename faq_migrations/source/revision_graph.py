@@ -0,0 +1,152 @@
+class RevisionGraph:
+    """
+    Reachability index of revision DAG. Revisions are numbered in topological
+    order, ancestors of every revision are kept as int bitset where bit
+    number is rank of revision, so ancestry questions are answered by bit
+    operations instead of walking of the graph
+    """
+
+    def __init__(self, revisions):
+        """
+        :param revisions: RevisionHeader objects in order from base to heads
+        """
+        self.order = []
+        self.ranks = {}
+        self.ancestors = []
+        self.bases = 0
+
+        for header in revisions:
+            rank = len(self.order)
+            mask = 1 << rank
+
+            for down_revision in header.down_revisions:
+                # unknown parents are reported by alembic itself
+                if down_revision in self.ranks:
+                    mask |= self.ancestors[self.ranks[down_revision]]
+
+            if not header.down_revisions:
+                self.bases |= 1 << rank
+
+            self.order.append(header.revision)
+            self.ranks[header.revision] = rank
+            self.ancestors.append(mask)
+
+        self.all = (1 << len(self.order)) - 1
+
+    def __contains__(self, revision):
+        return revision in self.ranks
+
+    def __len__(self):
+        return len(self.order)
+
+    def rank(self, revision):
+        """
+        :param revision: revision id
+        :return: position of revision in topological order
+        """
+        try:
+            return self.ranks[revision]
+        except KeyError:
+            raise ValueError('Revision {} is not found'.format(revision))
+
+    def bit(self, revision):
+        return 1 << self.rank(revision)
+
+    def mask(self, revisions):
+        """
+        Union of ancestors of revisions, revisions themselves are included
+
+        :param revisions: revision id, tuple of ids or None
+        :return: int bitset
+        """
+        if not revisions:
+            return 0
+
+        if isinstance(revisions, str):
+            return self.ancestors[self.rank(revisions)]
+
+        mask = 0
+
+        for revision in revisions:
+            mask |= self.ancestors[self.rank(revision)]
+
+        return mask
+
+    def revisions(self, mask):
+        """
+        :param mask: int bitset
+        :return: revision ids from bitset in topological order
+        """
+        return [self.order[rank]
+                for rank, bit in enumerate(reversed(bin(mask)[2:]))
+                if bit == '1']
+
+    def is_ancestor(self, ancestor, revision):
+        """
+        :return: True if revision is descendant of ancestor or the same one
+        """
+        return bool(self.mask(revision) & self.bit(ancestor))
+
+    def merge_base(self, *revisions):
+        """
+        Nearest common ancestor of revisions
+
+        :return: revision id or None if revisions have no common ancestor
+        """
+        common = self.all
+
+        for revision in revisions:
+            common &= self.mask(revision)
+
+        if not common:
+            return None
+
+        # common ancestor with the highest rank has no common descendants
+        return self.order[common.bit_length() - 1]
+
+    def descendants(self, mask):
+        """
+        Revisions which have ancestors in bitset, revisions of bitset
+        themselves are included
+
+        :param mask: int bitset
+        :return: int bitset
+        """
+        descendants = 0
+
+        for rank, ancestors in enumerate(self.ancestors):
+            if ancestors & mask:
+                descendants |= 1 << rank
+
+        return descendants
+
+    def heads(self, mask):
+        """
+        Revisions of bitset which are not ancestors of other revisions of it
+
+        :param mask: int bitset
+        :return: revision ids in topological order
+        """
+        heads = 0
+        covered = 0
+
+        # descendants have higher rank, so they are visited before ancestors
+        for rank in reversed(range(mask.bit_length())):
+            bit = 1 << rank
+
+            if mask & bit and not covered & bit:
+                heads |= bit
+                covered |= self.ancestors[rank]
+
+        return self.revisions(heads)
+
+    def pending(self, current, heads=None):
+        """
+        Revisions which are applied by upgrade from current to heads
+
+        :param current: revision id, tuple of ids or None for empty database
+        :param heads: revision id, tuple of ids or None for all revisions
+        :return: revision ids in order of applying
+        """
+        target = self.mask(heads) if heads else self.all
+        return self.revisions(target & ~self.mask(current))
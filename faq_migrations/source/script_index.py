@@ -0,0 +1,290 @@
+import json
+import os
+import re
+
+from faq_migrations.source.atomic_file import atomic_write
+from faq_migrations.source.header import read_header
+from faq_migrations.source.revision_graph import RevisionGraph
+
+
+INDEX_FILE = '.revision_index.json'
+INDEX_VERSION = 2
+
+# same filter that alembic uses for files under versions/
+_source_file = re.compile(r'(?!\.\#|__init__)(.*\.py)$')
+
+
+def to_tuple(value):
+    """
+    Normalize revision attribute (None, str, list or tuple) to tuple
+    """
+    if not value:
+        return ()
+
+    if isinstance(value, str):
+        return (value, )
+
+    return tuple(value)
+
+
+class RevisionHeader:
+    """
+    Light-weight replacement of alembic Script object. Keeps only header of
+    migration file and does not require importing of migration module
+    """
+
+    def __init__(self, path, revision, down_revision=None, branch_labels=None,
+                 depends_on=None, git_branch=None, doc='', squashed=None):
+        self.path = path
+        self.revision = revision
+        self.down_revision = down_revision
+        self.branch_labels = branch_labels
+        self.depends_on = depends_on
+        self.git_branch = git_branch
+        self.longdoc = (doc or '').strip()
+        # pairs of revision and down revision replaced by baseline
+        self.squashed = tuple(tuple(pair) for pair in squashed or ())
+        self.nextrev = set()
+
+    @classmethod
+    def from_dict(cls, path, data):
+        return cls(
+            path,
+            data['revision'],
+            down_revision=data.get('down_revision'),
+            branch_labels=data.get('branch_labels'),
+            depends_on=data.get('depends_on'),
+            git_branch=data.get('git_branch'),
+            doc=data.get('doc'),
+            squashed=data.get('squashed')
+        )
+
+    def to_dict(self):
+        return dict(
+            revision=self.revision,
+            down_revision=self.down_revision,
+            branch_labels=self.branch_labels,
+            depends_on=self.depends_on,
+            git_branch=self.git_branch,
+            doc=self.longdoc,
+            squashed=self.squashed
+        )
+
+    @property
+    def down_revisions(self):
+        return to_tuple(self.down_revision)
+
+    @property
+    def doc(self):
+        return re.split('\n\n', self.longdoc)[0]
+
+    @property
+    def is_head(self):
+        return not self.nextrev
+
+    @property
+    def is_base(self):
+        return not self.down_revisions
+
+    @property
+    def is_branch_point(self):
+        return len(self.nextrev) > 1
+
+    @property
+    def is_merge_point(self):
+        return len(self.down_revisions) > 1
+
+    def _format_down_revision(self):
+        if not self.down_revisions:
+            return '<base>'
+
+        return ', '.join(self.down_revisions)
+
+    @property
+    def log_entry(self):
+        entry = 'Rev: {}{}{}{}\n'.format(
+            self.revision,
+            ' (head)' if self.is_head else '',
+            ' (branchpoint)' if self.is_branch_point else '',
+            ' (mergepoint)' if self.is_merge_point else ''
+        )
+
+        if self.is_merge_point:
+            entry += 'Merges: {}\n'.format(self._format_down_revision())
+        else:
+            entry += 'Parent: {}\n'.format(self._format_down_revision())
+
+        if self.depends_on:
+            entry += 'Also depends on: {}\n'.format(
+                ', '.join(to_tuple(self.depends_on))
+            )
+
+        if self.is_branch_point:
+            entry += 'Branches into: {}\n'.format(
+                ', '.join(sorted(self.nextrev))
+            )
+
+        if self.squashed:
+            entry += 'Squashes: {} revisions\n'.format(len(self.squashed))
+
+        if self.branch_labels:
+            entry += 'Branch names: {}\n'.format(
+                ', '.join(to_tuple(self.branch_labels))
+            )
+
+        entry += 'Path: {}\n'.format(self.path)
+        entry += '\n{}\n'.format(
+            '\n'.join('    {}'.format(p) for p in self.longdoc.splitlines())
+        )
+        return entry
+
+    def __str__(self):
+        return '{} -> {}{}{}{}, {}'.format(
+            self._format_down_revision(),
+            self.revision,
+            ' (head)' if self.is_head else '',
+            ' (branchpoint)' if self.is_branch_point else '',
+            ' (mergepoint)' if self.is_merge_point else '',
+            self.doc
+        )
+
+    def __repr__(self):
+        return '<RevisionHeader {}>'.format(self.revision)
+
+
+class ScriptIndex:
+    """
+    Persistent index of migration headers stored in alembic directory. Every
+    entry is keyed by file name and validated by mtime and size, so only
+    changed files are parsed again
+    """
+
+    def __init__(self, alembic_dir):
+        self.alembic_dir = alembic_dir
+        self.versions_dir = os.path.join(alembic_dir, 'versions')
+        self.index_path = os.path.join(alembic_dir, INDEX_FILE)
+        self.revisions = {}
+        self._graph = None
+
+    def __read_index__(self):
+        try:
+            with open(self.index_path) as index_file:
+                data = json.load(index_file)
+        except (IOError, ValueError):
+            return {}
+
+        if data.get('version') != INDEX_VERSION:
+            return {}
+
+        return data.get('files', {})
+
+    def __write_index__(self, files):
+        try:
+            with atomic_write(self.index_path) as index_file:
+                json.dump(dict(version=INDEX_VERSION, files=files),
+                          index_file, indent=1, sort_keys=True)
+        except OSError:
+            # index is only a cache, it is written again by the next load
+            pass
+
+    def load(self):
+        """
+        Refresh index from versions directory and write it back if
+        something was changed
+
+        :return: self
+        """
+        cached = self.__read_index__()
+        files = {}
+        changed = False
+
+        for entry in sorted(os.scandir(self.versions_dir),
+                            key=lambda e: e.name):
+
+            if not entry.is_file() or not _source_file.match(entry.name):
+                continue
+
+            stat = entry.stat()
+            record = cached.get(entry.name)
+
+            if not record or record['mtime'] != stat.st_mtime_ns or \
+                    record['size'] != stat.st_size:
+                record = read_header(entry.path)
+                record.update(mtime=stat.st_mtime_ns, size=stat.st_size)
+                changed = True
+
+            files[entry.name] = record
+
+        if changed or set(files) != set(cached):
+            self.__write_index__(files)
+
+        self.revisions = {}
+        self._graph = None
+
+        for name, record in files.items():
+            header = RevisionHeader.from_dict(
+                os.path.join(self.versions_dir, name), record
+            )
+            self.revisions[header.revision] = header
+
+        for header in self.revisions.values():
+            for down_revision in header.down_revisions:
+                if down_revision in self.revisions:
+                    self.revisions[down_revision].nextrev.add(header.revision)
+
+        return self
+
+    def get_revision(self, revision_id):
+        return self.revisions[revision_id]
+
+    def get_heads(self):
+        """
+        :return: revision ids which does not have any descendants
+        """
+        return sorted(rev.revision for rev in self.revisions.values()
+                      if rev.is_head)
+
+    def walk_revisions(self):
+        """
+        Iterate through all revisions from heads to base. Revision is yielded
+        only after all of its descendants, like alembic does it
+
+        :return: RevisionHeader objects
+        """
+        pending = {rev: len(header.nextrev)
+                   for rev, header in self.revisions.items()}
+        ready = self.get_heads()
+
+        while ready:
+            revision = self.revisions[ready.pop(0)]
+            yield revision
+
+            for down_revision in sorted(revision.down_revisions):
+                if down_revision not in pending:
+                    continue
+
+                pending[down_revision] -= 1
+
+                if not pending[down_revision]:
+                    ready.append(down_revision)
+
+    def iterate_from_base(self):
+        """
+        Iterate through all revisions from base to heads in the same order
+        as alembic applies them, it is reversed order of walk_revisions
+
+        :return: RevisionHeader objects
+        """
+        return reversed(list(self.walk_revisions()))
+
+    @property
+    def graph(self):
+        """
+        Reachability index, it is built once per loaded index
+
+        :return: RevisionGraph object
+        """
+        if self._graph is None:
+            self._graph = RevisionGraph(self.iterate_from_base())
+
+        return self._graph
@@ -0,0 +1,331 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import uuid
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from sqlalchemy import DDL, MetaData, func, select, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from faq_migrations.source.atomic_file import atomic_write
+from faq_migrations.source.lock import LOCK_TABLE
+
+
+SNAPSHOTS_DIR = '.snapshots'
+SNAPSHOT_VERSION = 3
+
+# values which are not JSON types are stored as {"type": ..., "value": ...}
+_decoders = dict(
+    datetime=datetime.fromisoformat,
+    date=date.fromisoformat,
+    time=time.fromisoformat,
+    timedelta=lambda value: timedelta(seconds=value),
+    decimal=Decimal,
+    bytes=base64.b64decode,
+    uuid=uuid.UUID,
+    # dicts and lists of JSON columns are wrapped too, so they are not
+    # mistaken for encoded values
+    json=lambda value: value,
+)
+
+# schema objects which are lost by reflection of tables and indexes, objects
+# of extensions are created by the extension itself
+_not_extension = '''
+    NOT EXISTS (SELECT 1 FROM pg_depend d
+                WHERE d.objid = {}.oid AND d.deptype = 'e')
+'''
+
+POSTGRESQL_UNSUPPORTED = [
+    '''
+    SELECT 'extension ' || extname FROM pg_extension
+    WHERE extname <> 'plpgsql'
+    ''',
+    '''
+    SELECT 'schema ' || n.nspname FROM pg_namespace n
+    WHERE n.nspname <> 'information_schema'
+      AND left(n.nspname, 3) <> 'pg_' AND n.nspname <> current_schema()
+      AND EXISTS (SELECT 1 FROM pg_class c WHERE c.relnamespace = n.oid)
+    ''',
+    '''
+    SELECT 'type ' || t.typname FROM pg_type t
+    JOIN pg_namespace n ON n.oid = t.typnamespace
+    WHERE n.nspname = current_schema()
+      AND (t.typtype IN ('e', 'd', 'r') OR t.typtype = 'c' AND
+           (SELECT c.relkind FROM pg_class c WHERE c.oid = t.typrelid) = 'c')
+      AND {}
+    '''.format(_not_extension.format('t')),
+    '''
+    SELECT CASE c.relkind WHEN 'S' THEN 'sequence ' ELSE 'view ' END
+           || c.relname FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND c.relkind IN ('v', 'm', 'S')
+      AND NOT EXISTS (SELECT 1 FROM pg_depend d WHERE d.objid = c.oid
+                      AND d.deptype IN ('a', 'i', 'e'))
+    ''',
+    '''
+    SELECT 'function ' || p.proname FROM pg_proc p
+    JOIN pg_namespace n ON n.oid = p.pronamespace
+    WHERE n.nspname = current_schema() AND {}
+    '''.format(_not_extension.format('p')),
+    '''
+    SELECT 'trigger ' || tgname FROM pg_trigger WHERE NOT tgisinternal
+    ''',
+    '''
+    SELECT 'constraint ' || conname FROM pg_constraint WHERE contype = 'x'
+    ''',
+]
+
+SQLITE_UNSUPPORTED = [
+    '''
+    SELECT type || ' ' || name FROM sqlite_master
+    WHERE type IN ('view', 'trigger')
+    ''',
+]
+
+
+def encode_value(value):
+    """
+    Column value as JSON value, snapshots never execute code when loaded
+
+    :param value: value of column
+    :return: JSON type
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+
+    # datetime is subclass of date, it goes first
+    for name, value_type, encode in (
+        ('datetime', datetime, datetime.isoformat),
+        ('date', date, date.isoformat),
+        ('time', time, time.isoformat),
+        ('timedelta', timedelta, timedelta.total_seconds),
+        ('decimal', Decimal, str),
+        ('bytes', (bytes, bytearray, memoryview),
+         lambda data: base64.b64encode(bytes(data)).decode('ascii')),
+        ('uuid', uuid.UUID, str),
+        ('json', (dict, list), lambda data: data),
+    ):
+        if isinstance(value, value_type):
+            return dict(type=name, value=encode(value))
+
+    raise TypeError('Value of type {} can\'t be saved into snapshot'.format(
+        type(value).__name__
+    ))
+
+
+def decode_value(value):
+    """
+    Column value encoded by encode_value
+
+    :param value: JSON value
+    :return: value of column
+    """
+    if isinstance(value, dict):
+        return _decoders[value['type']](value['value'])
+
+    return value
+
+
+# same filter that alembic uses for files under versions/
+_source_file = re.compile(r'(?!\.\#|__init__)(.*\.py)$')
+
+
+def versions_hash(versions_dir):
+    """
+    Hash of names and content of migration files
+
+    :param versions_dir: path to versions directory
+    :return: hex digest
+    """
+    digest = hashlib.sha1()
+
+    for name in sorted(os.listdir(versions_dir)):
+        if not _source_file.match(name):
+            continue
+
+        digest.update(name.encode('utf-8'))
+
+        with open(os.path.join(versions_dir, name), 'rb') as migration:
+            digest.update(migration.read())
+
+    return digest.hexdigest()
+
+
+class SchemaSnapshot:
+    """
+    Schema and rows of migrated database, including alembic_version and
+    alembic_version_history. Snapshot is keyed by dialect, head revision and
+    hash of versions directory, so it is captured again only when migration
+    files are changed
+    """
+
+    def __init__(self, alembic_dir):
+        self.versions_dir = os.path.join(alembic_dir, 'versions')
+        self.snapshots_dir = os.path.join(alembic_dir, SNAPSHOTS_DIR)
+
+    def path(self, dialect, head):
+        """
+        :param dialect: name of SQLAlchemy dialect
+        :param head: head revision id
+        :return: path to snapshot file
+        """
+        return os.path.join(self.snapshots_dir, '{}-{}-{}.json'.format(
+            dialect, head, versions_hash(self.versions_dir)
+        ))
+
+    @staticmethod
+    def load(path):
+        """
+        :param path: path to snapshot file
+        :return: snapshot dict or None if it does not exist
+        """
+        try:
+            with open(path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (IOError, ValueError):
+            return None
+
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+
+        snapshot['rows'] = [
+            (table_name, [{name: decode_value(value)
+                           for name, value in row.items()} for row in rows])
+            for table_name, rows in snapshot['rows']
+        ]
+
+        return snapshot
+
+    def save(self, path, snapshot):
+        """
+        Write snapshot and remove outdated snapshots of the same dialect.
+        Snapshot which can't be written is captured again by the next
+        bootstrap. Snapshot with values of unknown types is not written
+
+        :param path: path to snapshot file
+        :param snapshot: snapshot dict
+        :return: True if snapshot is written
+        """
+        try:
+            rows = [
+                (table_name, [{name: encode_value(value)
+                               for name, value in row.items()}
+                              for row in rows])
+                for table_name, rows in snapshot['rows']
+            ]
+        except TypeError:
+            return False
+
+        try:
+            os.makedirs(self.snapshots_dir, exist_ok=True)
+
+            with atomic_write(path) as snapshot_file:
+                json.dump(dict(snapshot, rows=rows), snapshot_file)
+        except OSError:
+            return False
+
+        dialect = os.path.basename(path).split('-')[0]
+
+        for name in os.listdir(self.snapshots_dir):
+            outdated = os.path.join(self.snapshots_dir, name)
+
+            if name.startswith(dialect + '-') and outdated != path:
+                try:
+                    os.remove(outdated)
+                except FileNotFoundError:
+                    # removed by concurrent bootstrap
+                    pass
+
+        return True
+
+    @staticmethod
+    def capture(connection):
+        """
+        Read DDL and rows of all tables. Table of migrate lock is created by
+        the lock itself
+
+        :param connection: connection to migrated database
+        :return: snapshot dict
+        """
+        metadata = MetaData()
+        metadata.reflect(bind=connection,
+                         only=lambda name, _: name != LOCK_TABLE)
+
+        statements = []
+        rows = []
+
+        for table in metadata.sorted_tables:
+            statements.append(str(
+                CreateTable(table).compile(dialect=connection.dialect)
+            ))
+
+            for index in sorted(table.indexes, key=lambda i: i.name or ''):
+                statements.append(str(
+                    CreateIndex(index).compile(dialect=connection.dialect)
+                ))
+
+            rows.append((table.name, [
+                dict(row) for row in connection.execute(table.select())
+            ]))
+
+        return dict(version=SNAPSHOT_VERSION, statements=statements,
+                    rows=rows)
+
+    @staticmethod
+    def unsupported(connection):
+        """
+        Schema objects which are not captured by snapshot: views, triggers
+        and for Postgres also extensions, user types, functions, standalone
+        sequences and exclusion constraints. Only Postgres and SQLite are
+        checked, schema of other dialects is never captured
+
+        :param connection: connection to migrated database
+        :return: descriptions of objects, empty if snapshot can be used
+        """
+        queries = dict(postgresql=POSTGRESQL_UNSUPPORTED,
+                       sqlite=SQLITE_UNSUPPORTED)
+        dialect = connection.dialect.name
+
+        if dialect not in queries:
+            return ['schema of {} database'.format(dialect)]
+
+        return [description for query in queries[dialect]
+                for description, in connection.execute(text(query))]
+
+    @staticmethod
+    def restore(connection, snapshot):
+        """
+        Create tables of snapshot and fill them with bulk inserts
+
+        :param connection: connection to empty database
+        :param snapshot: snapshot dict
+        """
+        for statement in snapshot['statements']:
+            # DDL formats statement with %, literal percents are escaped
+            connection.execute(DDL(statement.replace('%', '%%')))
+
+        metadata = MetaData()
+        metadata.reflect(bind=connection)
+
+        for table_name, rows in snapshot['rows']:
+            if rows:
+                connection.execute(metadata.tables[table_name].insert(), rows)
+
+        if connection.dialect.name == 'postgresql':
+            # serial columns continue after restored ids
+            for table in metadata.sorted_tables:
+                for column in table.primary_key.columns:
+                    sequence = connection.scalar(select([
+                        func.pg_get_serial_sequence(table.name, column.name)
+                    ]))
+
+                    if sequence:
+                        connection.execute(select([func.setval(
+                            sequence,
+                            select([func.coalesce(func.max(column), 0) + 1])
+                            .as_scalar(),
+                            False
+                        )]))
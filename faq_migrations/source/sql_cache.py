@@ -0,0 +1,110 @@
+import hashlib
+import io
+import os
+from functools import wraps
+
+import alembic
+import sqlalchemy
+
+from faq_migrations.source.atomic_file import atomic_write
+
+
+SQL_CACHE_DIR = '.sql_cache'
+
+# options of context which depend on the range of generated script
+_RANGE_OPTIONS = ('starting_rev', 'destination_rev', 'tag')
+
+
+class SqlCache:
+    """
+    Offline SQL rendered by upgrade() of migration files. Entries are keyed by
+    dialect and hash of file content, so only new or changed migrations are
+    rendered again. Versions of alembic and SQLAlchemy, env.py and options of
+    context.configure are the part of key too, they change rendered SQL.
+    Statements of alembic_version and alembic_version_history are not cached,
+    they depend on the range of generated script
+    """
+
+    def __init__(self, alembic_dir):
+        self.cache_dir = os.path.join(alembic_dir, SQL_CACHE_DIR)
+        self.environment = '{} {}'.format(alembic.__version__,
+                                          sqlalchemy.__version__).encode()
+
+        try:
+            with open(os.path.join(alembic_dir, 'env.py'), 'rb') as env:
+                self.environment += env.read()
+        except IOError:
+            pass
+
+    def key(self, path, context):
+        """
+        Cache key of migration file
+
+        :param path: path to migration file
+        :param context: MigrationContext in as_sql mode
+        :return: string key
+        """
+        # only plain values of options are stable between runs
+        options = sorted(
+            (name, value) for name, value in context.opts.items()
+            if name not in _RANGE_OPTIONS
+            and isinstance(value, (str, int, float, bool, type(None)))
+        )
+        digest = hashlib.sha1(self.environment + repr(options).encode())
+
+        with open(path, 'rb') as migration:
+            digest.update(migration.read())
+
+        return '{}-{}'.format(context.dialect.name, digest.hexdigest())
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.cache_dir, key + '.sql')) as sql_file:
+                return sql_file.read()
+        except IOError:
+            return None
+
+    def put(self, key, sql):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+            with atomic_write(os.path.join(self.cache_dir,
+                                           key + '.sql')) as sql_file:
+                sql_file.write(sql)
+        except OSError:
+            # SQL is rendered again on the next miss
+            pass
+
+    def wrap(self, step, context):
+        """
+        Replace migration function of step with one which writes cached SQL
+        into output of offline context, or renders and caches it on miss
+
+        :param step: MigrationStep
+        :param context: MigrationContext in as_sql mode
+        :return: the same step
+        """
+        migration_fn = step.migration_fn
+        key = self.key(step.revision.path, context)
+
+        # name of function is written into `-- Running upgrade` comments
+        @wraps(migration_fn)
+        def render(**kwargs):
+            sql = self.get(key)
+
+            if sql is None:
+                output_buffer = context.impl.output_buffer
+                context.impl.output_buffer = io.StringIO()
+
+                try:
+                    migration_fn(**kwargs)
+                    sql = context.impl.output_buffer.getvalue()
+                finally:
+                    context.impl.output_buffer = output_buffer
+
+                self.put(key, sql)
+
+            context.impl.output_buffer.write(sql)
+
+        step.migration_fn = render
+        return step
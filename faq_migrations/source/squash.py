@@ -0,0 +1,164 @@
+import os
+from datetime import datetime
+
+from alembic.autogenerate import render_python_code
+from alembic.operations import ops
+
+from faq_migrations.models.history import VersionHistory
+from faq_migrations.source.lock import LOCK_TABLE
+
+
+SQUASHED_DIR = 'squashed'
+
+BASELINE = '''"""
+
+{message}
+
+Create Date: {create_date}
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = {revision!r}
+down_revision = None
+branch_labels = {branch_labels!r}
+depends_on = None
+git_branch = {git_branch!r}
+
+# revisions replaced by this baseline and their parents, they are written
+# into alembic_version_history when baseline is applied
+squashed = {squashed}
+
+from alembic import context, op
+import sqlalchemy as sa
+from sqlalchemy.dialects import {dialect}
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # table may be already created by `migrate` command
+    if context.is_offline_mode() or \\
+            not bind.dialect.has_table(bind, 'alembic_version_history'):
+{history_table}
+
+{upgrade}
+
+
+def downgrade():
+{downgrade}
+'''
+
+
+def create_ops(tables):
+    """
+    Operations which create tables with their indexes
+
+    :param tables: Table objects in order of dependencies
+    :return: UpgradeOps
+    """
+    upgrade_ops = []
+
+    for table in tables:
+        upgrade_ops.append(ops.CreateTableOp.from_table(table))
+
+        for index in sorted(table.indexes, key=lambda i: i.name or ''):
+            upgrade_ops.append(ops.CreateIndexOp.from_index(index))
+
+    return ops.UpgradeOps(ops=upgrade_ops)
+
+
+def render_ops(operations, context, indent):
+    """
+    Render operations as body of function without autogenerate comments
+
+    :param operations: UpgradeOps or DowngradeOps
+    :param context: MigrationContext which defines dialect of types
+    :param indent: indent of statements
+    :return: source code
+    """
+    lines = []
+
+    for line in render_python_code(
+            operations, migration_context=context).splitlines():
+        line = line.strip()
+
+        if not line or line.startswith('# ###'):
+            continue
+
+        # arguments of op.create_table() are written on separate lines
+        if not line.startswith(('op.', ')', 'pass')):
+            line = '    ' + line
+
+        lines.append(indent + line)
+
+    return '\n'.join(lines)
+
+
+def baseline_tables(metadata, context):
+    """
+    Tables created by baseline, tables of faq_migrations are not included
+
+    :param metadata: MetaData reflected from database at squashed revision
+    :param context: MigrationContext of the same database
+    :return: Table objects in order of dependencies
+    """
+    return [table for table in metadata.sorted_tables
+            if table.name not in (VersionHistory.__tablename__,
+                                  context.version_table, LOCK_TABLE)]
+
+
+def render_baseline(metadata, context, message, revision, squashed,
+                    branch_labels, git_branch):
+    """
+    Source of baseline migration which creates reflected schema
+
+    :param metadata: MetaData reflected from database at squashed revision
+    :param context: MigrationContext of the same database
+    :param message: docstring of migration
+    :param revision: revision id of baseline
+    :param squashed: tuples of revision and formatted down revision
+    :param branch_labels: branch labels of squashed revisions
+    :param git_branch: current git branch
+    :return: source code
+    """
+    tables = baseline_tables(metadata, context)
+
+    downgrade = ops.DowngradeOps(ops=[
+        ops.DropTableOp.from_table(table) for table in reversed(tables)
+    ])
+
+    return BASELINE.format(
+        message=message,
+        create_date=datetime.now(),
+        revision=revision,
+        branch_labels=branch_labels,
+        git_branch=git_branch,
+        squashed='(\n{})'.format(''.join(
+            '    {!r},\n'.format(tuple(pair)) for pair in squashed
+        )),
+        dialect=context.dialect.name,
+        history_table=render_ops(create_ops([VersionHistory.__table__]),
+                                 context, ' ' * 8),
+        upgrade=render_ops(create_ops(tables), context, ' ' * 4),
+        downgrade=render_ops(downgrade, context, ' ' * 4),
+    )
+
+
+def archive(paths, alembic_dir, revision):
+    """
+    Move migration files out of versions directory
+
+    :param paths: paths of migration files
+    :param alembic_dir: alembic directory
+    :param revision: revision id of baseline
+    :return: archive directory
+    """
+    archive_dir = os.path.join(alembic_dir, SQUASHED_DIR, revision)
+    os.makedirs(archive_dir, exist_ok=True)
+
+    for path in paths:
+        os.replace(path, os.path.join(archive_dir, os.path.basename(path)))
+
+    return archive_dir
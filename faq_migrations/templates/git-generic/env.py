@@ -44,7 +44,22 @@ def run_migrations_online():
     """Run migrations in 'online' mode.
     In this scenario we need to create an Engine
     and associate a connection with the context.
+    Connection passed by faq_migrations is used as is,
+    so history is written in the same transaction.
     """
+    connection = config.attributes.get('connection', None)
+
+    if connection is not None:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix='sqlalchemy.',
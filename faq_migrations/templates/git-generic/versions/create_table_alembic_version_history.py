@@ -19,11 +19,12 @@ import sys
 sys.path.insert(0, "..")
 
 
+from alembic import context
 from alembic.op import (add_column, create_foreign_key, create_table,
                         drop_constraint, create_unique_constraint,
                         create_index, drop_index, alter_column,
                         drop_column, drop_table, execute, get_bind, rename_table)
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Date, ForeignKey, text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Date, ForeignKey, text, Float
 from sqlalchemy.dialects.postgresql import JSON
 
 
@@ -77,12 +78,25 @@ from sqlalchemy.dialects.postgresql import JSON
 
 
 def upgrade():
+    bind = get_bind()
+
+    # table may be already created by `migrate` command
+    if not context.is_offline_mode() and \
+            bind.dialect.has_table(bind, 'alembic_version_history'):
+        return
+
     create_table(
         'alembic_version_history',
         Column('id', Integer, primary_key=True),
-        Column('previous_revision', String, nullable=False),
-        Column('forward_revision', String, nullable=False),
+        Column('from_ver', String, nullable=False),
+        Column('to_ver', String, nullable=False),
+        Column('started_at', DateTime, nullable=True),
+        Column('duration', Float, nullable=True),
+        Column('direction', String, nullable=True),
+        Column('git_branch', String, nullable=True),
     )
+    create_index('ix_alembic_version_history_to_ver_from_ver',
+                 'alembic_version_history', ['to_ver', 'from_ver'])
 
 
 def downgrade():
@@ -1,4 +1,21 @@
+from faq_migrations.tests.attribution_test import *
+from faq_migrations.tests.bootstrap_test import *
 from faq_migrations.tests.database_test import *
+from faq_migrations.tests.downgrade_test import *
+from faq_migrations.tests.git_repo_test import *
+from faq_migrations.tests.header_test import *
+from faq_migrations.tests.history_file_test import *
+from faq_migrations.tests.history_test import *
+from faq_migrations.tests.lock_test import *
+from faq_migrations.tests.merge_test import *
+from faq_migrations.tests.patch_test import *
+from faq_migrations.tests.revision_graph_test import *
+from faq_migrations.tests.script_index_test import *
+from faq_migrations.tests.snapshot_test import *
+from faq_migrations.tests.squash_test import *
+from faq_migrations.tests.sql_cache_test import *
+from faq_migrations.tests.targets_test import *
+from faq_migrations.tests.utils_test import *
 import unittest
 
 if __name__ == '__main__':
@@ -0,0 +1,98 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from faq_migrations.settings import config
+from faq_migrations.source.alembic_wrapper import AlembicMigrations
+from faq_migrations.source.attribution import GitAttribution, merged_branch
+from faq_migrations.source.script_index import RevisionHeader
+
+
+class GitAttributionTestCase(unittest.TestCase):
+    """
+    Master adds a.py, removed branch `feature` adds b.py and is merged into
+    master, which adds é.py meanwhile. Branches `aaa` and `zzz` are created
+    from master after merge
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.versions_dir = os.path.join(self.path, 'versions')
+        os.makedirs(self.versions_dir)
+
+        self.git('init', '-q')
+        self.git('checkout', '-q', '-b', 'master')
+
+        self.add('a.py')
+        self.git('checkout', '-q', '-b', 'feature')
+        self.add('b.py')
+        self.git('checkout', '-q', 'master')
+        self.add('é.py')
+        self.git('merge', '-q', '--no-ff', '-m', "Merge branch 'feature'",
+                 'feature')
+        self.git('branch', '-q', '-D', 'feature')
+        self.git('branch', 'aaa')
+        self.git('branch', 'zzz')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def git(self, *args):
+        subprocess.check_call(
+            ('git', '-c', 'user.name=test', '-c', 'user.email=test@test') +
+            args, cwd=self.path
+        )
+
+    def add(self, name):
+        open(os.path.join(self.versions_dir, name), 'w').close()
+        self.git('add', '.')
+        self.git('commit', '-q', '-m', name)
+
+    def test_branch_of_first_parent_history_and_merge(self):
+        attribution = GitAttribution(self.path).load()
+
+        self.assertEqual(attribution.branch('a.py'), 'master')
+        self.assertEqual(attribution.branch('b.py'), 'feature')
+        self.assertEqual(attribution.branch('é.py'), 'master')
+        self.assertIsNone(attribution.branch('c.py'))
+
+    def test_new_commits(self):
+        GitAttribution(self.path).load()
+
+        self.git('checkout', '-q', 'zzz')
+        self.add('c.py')
+
+        attribution = GitAttribution(self.path).load()
+
+        self.assertEqual(attribution.branch('c.py'), 'zzz')
+        self.assertEqual(attribution.branch('a.py'), 'master')
+
+    def test_merged_branch(self):
+        self.assertEqual(merged_branch("Merge branch 'f/x' into master"),
+                         'f/x')
+        self.assertEqual(
+            merged_branch("Merge remote-tracking branch 'origin/f/x'"), 'f/x'
+        )
+        self.assertEqual(
+            merged_branch('Merge pull request #12 from owner/f/x'), 'f/x'
+        )
+        self.assertIsNone(merged_branch('Merge develop -> master'))
+
+    def test_git_branch_of_file_is_preferred(self):
+        saved = config.alembic_dir
+        config.alembic_dir = self.path + os.sep
+
+        try:
+            migrations = AlembicMigrations()
+            path = os.path.join(self.versions_dir, 'b.py')
+
+            self.assertEqual(migrations.branch_name(
+                RevisionHeader(path, 'b', git_branch='develop')
+            ), 'develop')
+            self.assertEqual(migrations.branch_name(
+                RevisionHeader(path, 'b')
+            ), 'feature')
+        finally:
+            config.alembic_dir = saved
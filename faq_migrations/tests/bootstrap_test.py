@@ -0,0 +1,61 @@
+import unittest
+from unittest import mock
+
+from faq_migrations.source.alembic_wrapper import AlembicMigrations
+from faq_migrations.source.lock import MigrationLock
+from faq_migrations.source.snapshot import SchemaSnapshot
+from faq_migrations.tests.workspace import Workspace
+
+
+class BootstrapTestCase(Workspace, unittest.TestCase):
+    """
+    Chain B -> C of the initial migration, snapshot is captured by bootstrap
+    of the workspace database
+    """
+
+    def setUp(self):
+        super(BootstrapTestCase, self).setUp()
+
+        self.write('b', self.base)
+        self.write('c', 'b')
+        self.reload()
+
+        self.assertTrue(self.am.bootstrap())
+
+    def session(self, name):
+        session = AlembicMigrations(self.database(name))
+        self.addCleanup(session.close)
+        return session
+
+    def test_restore_of_snapshot(self):
+        fresh = self.session('fresh')
+
+        self.assertTrue(fresh.bootstrap())
+        self.assertEqual(fresh.context.get_current_heads(), ('c', ))
+        self.assertTrue(fresh.engine.dialect.has_table(fresh.conn, 't_b'))
+        self.assertIsNone(fresh.bootstrap())
+
+    def test_database_restored_by_other_replica(self):
+        fresh = self.session('fresh')
+        owner = self.session('fresh')
+        load = SchemaSnapshot.load
+
+        def load_and_restore_by_owner(path):
+            snapshot = load(path)
+
+            # other replica restores database after emptiness check
+            lock = MigrationLock(owner.engine)
+            self.assertTrue(lock.acquire())
+
+            with owner.conn.begin():
+                SchemaSnapshot.restore(owner.conn, snapshot)
+
+            lock.release()
+
+            return snapshot
+
+        with mock.patch.object(SchemaSnapshot, 'load',
+                               side_effect=load_and_restore_by_owner):
+            self.assertIsNone(fresh.bootstrap())
+
+        self.assertEqual(owner.context.get_current_heads(), ('c', ))
@@ -1,10 +1,11 @@
 import unittest
-from .utils import AlembicSession
+from .utils import AlembicSession, configure
 
 
 class MigratingTestCase(unittest.TestCase):
 
     def setUp(self):
+        configure()
 
         # Initializing git/alembic branches
         self.master = AlembicSession('master')
@@ -17,7 +18,7 @@ class MigratingTestCase(unittest.TestCase):
         self.master.set_active_branch()
 
         print('Init alembic')
-        self.master.alembic.init()
+        self.master.init()
 
         for m in range(1, 4):
             print(f'Create migration master:{m}')
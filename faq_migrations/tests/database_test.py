@@ -1,10 +1,11 @@
 import unittest
-from .utils import AlembicSession
+from .utils import AlembicSession, configure
 
 
 class MigratingTestCase(unittest.TestCase):
 
     def setUp(self):
+        configure()
 
         # Initializing git/alembic branches
         self.master = AlembicSession('master')
@@ -16,7 +17,7 @@ class MigratingTestCase(unittest.TestCase):
         self.master.set_active_branch()
 
         print('Init alembic')
-        self.master.alembic.init()
+        self.master.init()
 
         for m in range(1, 4):
             print('Create migration master:{}'.format(m))
@@ -26,7 +27,7 @@ class MigratingTestCase(unittest.TestCase):
         self.master.commit('master')
 
         print('Migrate master database')
-        self.master.alembic.migrate()
+        self.master.migrate()
 
         print('Switching to develop branch')
         self.develop.set_active_branch()
@@ -39,7 +40,7 @@ class MigratingTestCase(unittest.TestCase):
         self.develop.commit('develop')
 
         print('Migrate develop database')
-        self.develop.alembic.migrate()
+        self.develop.migrate()
 
         print('Switch to master branch')
         self.master.set_active_branch()
@@ -51,13 +52,13 @@ class MigratingTestCase(unittest.TestCase):
         self.master.commit('master')
 
         print('Migrate master database')
-        self.master.alembic.migrate()
+        self.master.migrate()
 
         print('Merge db master -> develop')
         self.master.merge(self.master.branch, self.develop.branch)
 
         print('Migrate master')
-        self.master.alembic.migrate()
+        self.master.migrate()
 
     def tearDown(self):
 
@@ -0,0 +1,132 @@
+import os
+import unittest
+
+from sqlalchemy import select
+
+from faq_migrations.models.history import VersionHistory, history_columns
+from faq_migrations.source.alembic_wrapper import CompareLocalRemote
+from faq_migrations.tests.workspace import Workspace
+
+
+class DowngradeTestCase(Workspace, unittest.TestCase):
+    """
+    Branches B -> D and C -> E of the initial migration are applied in
+    turns: B, C, D, E
+    """
+
+    def setUp(self):
+        super(DowngradeTestCase, self).setUp()
+
+        self.write('b', self.base)
+        self.write('c', self.base)
+        self.write('d', 'b')
+        self.write('e', 'c')
+        self.reload()
+
+        for revision in ('b', 'c', 'd', 'e'):
+            self.upgrade(revision)
+
+    def test_last_migration(self):
+        self.am.downgrade(1)
+
+        self.assertEqual(self.heads(), ['c', 'd'])
+        self.assertEqual(self.history(), ['b', 'c', 'd'])
+
+    def test_interleaved_branches_are_not_reverted(self):
+        # downgrade to `b` reverts `c` as well, it isn't one of last two
+        self.assertFalse(self.am.downgrade(2))
+
+        self.assertEqual(self.heads(), ['d', 'e'])
+        self.assertEqual(self.history(), ['b', 'c', 'd', 'e'])
+        self.assertTrue(self.has_table('t_c'))
+
+    def test_whole_history(self):
+        self.am.downgrade(4)
+
+        self.assertEqual(self.heads(), [self.base])
+        self.assertEqual(self.history(), [])
+
+    def test_downgrade_heads_keeps_other_branches(self):
+        self.am.downgrade_heads(['d'])
+
+        self.assertEqual(self.heads(), ['b', 'e'])
+        self.assertEqual(self.history(), ['b', 'c', 'e'])
+
+        self.am.downgrade_heads(['e', 'c'])
+
+        self.assertEqual(self.heads(), ['b'])
+        self.assertEqual(self.history(), ['b'])
+        self.assertFalse(self.has_table('t_c'))
+
+    def test_downgrade_heads_reverts_applied_descendants(self):
+        plan = self.am.downgrade_heads(['b'])
+
+        self.assertEqual([row.to_ver for row in plan], ['d', 'b'])
+        self.assertEqual(self.heads(), ['e'])
+        self.assertEqual(self.history(), ['c', 'e'])
+        self.assertFalse(self.has_table('t_d'))
+
+    def test_migrate_from_many_heads(self):
+        self.write('f', ('d', 'e'))
+        self.reload()
+
+        self.assertEqual(
+            [revision.revision for revision in self.am.upgrade_revisions()],
+            ['f']
+        )
+        self.assertTrue(self.am.migrate())
+        self.assertEqual(self.heads(), ['f'])
+
+    def legacy_history(self):
+        """
+        Replace history table by table of previous versions with the same
+        applied rows
+        """
+        history = VersionHistory.__table__
+
+        rows = self.am.conn.execute(
+            select([history.c.from_ver, history.c.to_ver])
+            .where(VersionHistory.applied()).order_by(history.c.id)
+        ).fetchall()
+
+        self.am.conn.execute('DROP TABLE alembic_version_history')
+        self.am.conn.execute(
+            'CREATE TABLE alembic_version_history (id INTEGER PRIMARY KEY, '
+            'from_ver VARCHAR NOT NULL, to_ver VARCHAR NOT NULL)'
+        )
+
+        for from_ver, to_ver in rows:
+            self.am.conn.execute(
+                'INSERT INTO alembic_version_history (from_ver, to_ver) '
+                'VALUES (?, ?)', from_ver, to_ver
+            )
+
+    def test_legacy_history_table(self):
+        self.write('f', ('d', 'e'))
+        self.reload()
+
+        # read commands and plan of downgrade don't alter the table
+        self.legacy_history()
+        CompareLocalRemote().compare_history()
+        CompareLocalRemote().export_history(
+            os.path.join(self.work_dir, 'history.bin')
+        )
+        self.assertEqual(self.am.timings(), [])
+        self.assertEqual([row.to_ver for row in
+                          self.am.downgrade_heads(['e'], dry_run=True)],
+                         ['e'])
+        self.assertNotIn('direction', history_columns(self.am.conn))
+
+        # columns are added by migrate before migrations are applied
+        self.assertTrue(self.am.migrate())
+        self.assertIn('direction', history_columns(self.am.conn))
+        self.assertEqual(self.heads(), ['f'])
+
+        self.legacy_history()
+        self.am.downgrade(1)
+        self.assertEqual(self.heads(), ['d', 'e'])
+
+        self.legacy_history()
+        self.am.downgrade_heads(['e'])
+        self.assertEqual(self.heads(), ['c', 'd'])
+        self.assertEqual(self.history(), ['b', 'c', 'd'])
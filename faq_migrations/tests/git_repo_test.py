@@ -0,0 +1,91 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from faq_migrations.source.git_repo import commit_time, current_branch, \
+    read_head
+
+
+SHA = 'a' * 40
+
+
+class GitRepoTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.git_dir = os.path.join(self.path, '.git')
+        os.makedirs(os.path.join(self.git_dir, 'refs', 'heads'))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write(self, name, content):
+        with open(os.path.join(self.git_dir, name), 'w') as git_file:
+            git_file.write(content)
+
+    def test_branch(self):
+        self.write('HEAD', 'ref: refs/heads/develop\n')
+        self.assertEqual(read_head(self.path), 'develop')
+
+    def test_checkout_is_noticed(self):
+        self.write('HEAD', 'ref: refs/heads/master\n')
+        self.assertEqual(current_branch(self.path), 'master')
+
+        self.write('HEAD', 'ref: refs/heads/develop\n')
+        self.assertEqual(current_branch(self.path), 'develop')
+
+    def test_detached_packed_ref(self):
+        self.write('HEAD', SHA + '\n')
+        self.write('packed-refs', '# pack-refs with: peeled\n'
+                                  '{} refs/heads/release\n'.format(SHA))
+
+        nested = os.path.join(self.path, 'migrations')
+        os.makedirs(nested)
+
+        self.assertEqual(read_head(nested), 'release')
+
+    def test_detached_unknown_commit(self):
+        self.write('HEAD', SHA + '\n')
+        self.assertEqual(read_head(self.path), SHA[:12])
+
+    def test_worktree(self):
+        self.write('HEAD', 'ref: refs/heads/master\n')
+        worktree_git_dir = os.path.join(self.git_dir, 'worktrees', 'wt')
+        os.makedirs(worktree_git_dir)
+
+        with open(os.path.join(worktree_git_dir, 'HEAD'), 'w') as head:
+            head.write('ref: refs/heads/feature/x\n')
+
+        worktree = os.path.join(self.path, 'wt')
+        os.makedirs(worktree)
+
+        with open(os.path.join(worktree, '.git'), 'w') as dot_git:
+            dot_git.write('gitdir: {}\n'.format(worktree_git_dir))
+
+        self.assertEqual(read_head(worktree), 'feature/x')
+
+    def git(self, *args, **kwargs):
+        return subprocess.check_output(
+            ('git', '-c', 'user.name=test', '-c', 'user.email=test@test') +
+            args, cwd=self.path, **kwargs
+        ).decode('utf-8').strip()
+
+    def test_commit_time(self):
+        shutil.rmtree(self.git_dir)
+        self.git('init', '-q')
+        self.git('checkout', '-q', '-b', 'feature/x')
+        self.git('commit', '-q', '--allow-empty', '-m', 'initial',
+                 env=dict(os.environ, GIT_COMMITTER_DATE='1600000000 +0000'))
+        sha = self.git('rev-parse', 'HEAD')
+
+        self.assertEqual(commit_time('feature/x', self.path), 1600000000)
+        self.assertEqual(commit_time(sha[:12], self.path), 1600000000)
+        self.assertIsNone(commit_time('master', self.path))
+
+        # values of migration files are never options of git
+        output = os.path.join(self.path, 'output')
+        self.assertIsNone(commit_time('--output=' + output, self.path))
+        self.assertIsNone(commit_time('@{-1}', self.path))
+        self.assertFalse(os.path.exists(output))
@@ -0,0 +1,51 @@
+import unittest
+
+from faq_migrations.source.header import parse_header, HeaderError
+
+
+SOURCE = '''"""
+
+merge_a_into_b
+
+"""
+
+revision = 'c'
+down_revision = ('a', 'b')
+branch_labels = None
+depends_on = None
+git_branch = 'develop'
+
+import sys
+sys.path.insert(0, "..")
+
+from alembic.op import create_table
+'''
+
+
+class HeaderTestCase(unittest.TestCase):
+
+    def test_parse_header(self):
+        header = parse_header(SOURCE)
+
+        self.assertEqual(header['revision'], 'c')
+        self.assertEqual(header['down_revision'], ('a', 'b'))
+        self.assertEqual(header['git_branch'], 'develop')
+        self.assertEqual(header['doc'].strip(), 'merge_a_into_b')
+
+    def test_not_literal(self):
+        with self.assertRaises(HeaderError):
+            parse_header("revision = 'a'\ndown_revision = get_parent()\n")
+
+    def test_without_revision(self):
+        with self.assertRaises(HeaderError):
+            parse_header("down_revision = None\n")
+
+    def test_squashed(self):
+        header = parse_header(
+            "revision = 'c'\ndown_revision = None\n"
+            "squashed = (('b', 'a'), ('c', \"('a', 'b')\"))\n"
+        )
+
+        self.assertIsNone(header['down_revision'])
+        self.assertEqual(header['squashed'],
+                         (('b', 'a'), ('c', "('a', 'b')")))
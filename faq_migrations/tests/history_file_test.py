@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+
+from faq_migrations.source.history_file import (HistoryRecord,
+                                                is_history_file,
+                                                read_history, write_history)
+
+
+class HistoryFileTestCase(unittest.TestCase):
+
+    def test_write_read(self):
+        rows = [HistoryRecord('a', 'b'), HistoryRecord("('b', 'c')", 'd')]
+
+        with tempfile.TemporaryFile() as history_file:
+            self.assertEqual(write_history(iter(rows), history_file), 2)
+            history_file.flush()
+            history_file.seek(0)
+
+            self.assertTrue(is_history_file(history_file))
+            self.assertEqual(list(read_history(history_file)), rows)
+
+    def test_not_history_file(self):
+
+        with tempfile.TemporaryFile() as history_file:
+            history_file.write(b'\x80\x03]q\x00.')
+            history_file.seek(0)
+
+            self.assertFalse(is_history_file(history_file))
+
+            with self.assertRaises(ValueError):
+                list(read_history(history_file))
+
+    def test_truncated_file(self):
+        rows = [HistoryRecord('a', 'b'), HistoryRecord('bc', 'de')]
+
+        with tempfile.TemporaryFile() as history_file:
+            write_history(iter(rows), history_file)
+            size = history_file.tell()
+
+            # cut inside of the last record and inside of its length header
+            for length in (size - 1, size - 6):
+                history_file.truncate(length)
+                history_file.seek(0)
+
+                with self.assertRaisesRegex(ValueError,
+                                            'History file is truncated'):
+                    list(read_history(history_file))
+
+            # cut inside of file header
+            history_file.truncate(3)
+
+            with self.assertRaisesRegex(ValueError, 'not a migration'):
+                list(read_history(history_file))
@@ -0,0 +1,28 @@
+import unittest
+
+from faq_migrations.tests.workspace import Workspace
+
+
+class HistoryTestCase(Workspace, unittest.TestCase):
+    """
+    Chain B -> C -> D of the initial migration
+    """
+
+    def setUp(self):
+        super(HistoryTestCase, self).setUp()
+
+        self.write('b', self.base)
+        self.write('c', 'b')
+        self.write('d', 'c')
+        self.reload()
+
+    def revisions(self, *args):
+        return [revision.revision for revision in self.am.history(*args)]
+
+    def test_newest_at_the_top(self):
+        self.assertEqual(self.revisions(2), ['d', 'c'])
+        self.assertEqual(self.revisions(), ['d', 'c', 'b', self.base])
+
+    def test_oldest_at_the_top(self):
+        self.assertEqual(self.revisions(2, False), ['c', 'd'])
+        self.assertEqual(self.revisions(20, False), [self.base, 'b', 'c', 'd'])
@@ -0,0 +1,77 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from faq_migrations.source.lock import MigrationLock, is_lock_conflict, \
+    lock_table
+
+
+class MigrationLockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite:///{}'.format(
+            os.path.join(self.work_dir, 'db.sqlite')
+        ))
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.work_dir)
+
+    def test_one_owner(self):
+        owner = MigrationLock(self.engine)
+        waiter = MigrationLock(self.engine)
+
+        self.assertTrue(owner.acquire())
+        self.assertFalse(waiter.acquire())
+
+        owner.release()
+
+        self.assertTrue(waiter.acquire())
+        waiter.release()
+
+    def test_owner_refreshes_lock(self):
+        owner = MigrationLock(self.engine, stale_timeout=2,
+                              refresh_interval=0.2)
+        waiter = MigrationLock(self.engine, stale_timeout=2)
+
+        self.assertTrue(owner.acquire())
+
+        # migration takes longer than stale timeout
+        time.sleep(3)
+
+        self.assertFalse(waiter.acquire())
+        owner.release()
+        waiter.release()
+
+    def test_stale_lock_of_died_owner(self):
+        lock_table.create(self.engine)
+        self.engine.execute(lock_table.insert().values(
+            id=1, owner='died', locked_at=datetime(2000, 1, 1)
+        ))
+
+        waiter = MigrationLock(self.engine)
+
+        self.assertTrue(waiter.acquire())
+        waiter.release()
+
+    def test_lock_conflict(self):
+        def error(cls, message):
+            return cls('INSERT', {}, sqlite3.OperationalError(message))
+
+        self.assertTrue(is_lock_conflict(
+            error(IntegrityError, 'UNIQUE constraint failed'), 'sqlite'
+        ))
+        self.assertTrue(is_lock_conflict(
+            error(OperationalError, 'database is locked'), 'sqlite'
+        ))
+        self.assertFalse(is_lock_conflict(
+            error(OperationalError, 'disk I/O error'), 'sqlite'
+        ))
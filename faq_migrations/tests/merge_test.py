@@ -0,0 +1,49 @@
+import os
+import subprocess
+import unittest
+
+from faq_migrations.tests.workspace import Workspace
+
+
+class MergeTestCase(Workspace, unittest.TestCase):
+    """
+    Heads X, Y and Z of the initial migration are created on branches `new`,
+    `old` and removed branch `gone`. Workspace is git repository, the last
+    commit of `old` is older than the last commit of `new`
+    """
+
+    def setUp(self):
+        super(MergeTestCase, self).setUp()
+
+        for args, date in ((('init', '-q'), None),
+                           (('checkout', '-q', '-b', 'old'), None),
+                           (('commit', '-q', '--allow-empty', '-m', 'old'),
+                            '1600000000 +0000'),
+                           (('checkout', '-q', '-b', 'new'), None),
+                           (('commit', '-q', '--allow-empty', '-m', 'new'),
+                            '1700000000 +0000')):
+            subprocess.check_call(
+                ('git', '-c', 'user.name=test', '-c', 'user.email=test@test')
+                + args, cwd=self.work_dir,
+                env=dict(os.environ, GIT_COMMITTER_DATE=date or '')
+            )
+
+        self.write('x', self.base, git_branch='new')
+        self.write('y', self.base, git_branch='old')
+        self.write('z', self.base, git_branch='gone')
+        self.reload()
+
+    def test_order_of_heads(self):
+        self.assertEqual(
+            [head.revision for head in self.am.merge_order(self.am.heads)],
+            ['y', 'x', 'z']
+        )
+
+    def test_auto_merge(self):
+        self.am.merge(auto=True)
+        self.reload()
+
+        heads = list(self.am.heads)
+
+        self.assertEqual(len(heads), 1)
+        self.assertEqual(heads[0].down_revision, ('y', 'x', 'z'))
@@ -0,0 +1,92 @@
+import unittest
+
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from faq_migrations import patch
+from faq_migrations.source.alembic_wrapper import CompareLocalRemote
+from faq_migrations.tests.workspace import Workspace
+
+
+class PatchedHeadMaintainerTestCase(Workspace, unittest.TestCase):
+    """
+    Chain B -> C -> D of the initial migration, D fails
+    """
+
+    def setUp(self):
+        super(PatchedHeadMaintainerTestCase, self).setUp()
+
+        self.write('b', self.base)
+        self.write('c', 'b')
+        self.write('d', 'c', fail=True)
+        self.reload()
+
+    def test_failed_step_keeps_history_of_done_steps(self):
+        # SQLite has no transactional DDL, done steps are committed
+        with self.assertRaises(OperationalError):
+            self.am.migrate()
+
+        self.reload()
+
+        self.assertEqual(self.heads(), ['c'])
+        self.assertEqual(self.history(), ['b', 'c'])
+
+        CompareLocalRemote().compare_history()
+
+
+class TransactionModeTestCase(Workspace, unittest.TestCase):
+    """
+    Chain B -> C -> D -> E of the initial migration, E fails. SQLite runs
+    DDL in transactions opened by SQLAlchemy, so commit boundaries of
+    transaction modes are seen
+    """
+
+    def setUp(self):
+        super(TransactionModeTestCase, self).setUp()
+
+        engine = self.am.engine
+
+        @event.listens_for(engine, 'connect')
+        def connect(dbapi_connection, connection_record):
+            # pysqlite doesn't open transactions by itself
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, 'begin')
+        def begin(connection):
+            connection.execute('BEGIN')
+
+        self.write('b', self.base)
+        self.write('c', 'b')
+        self.write('d', 'c')
+        self.write('e', 'd', fail=True)
+        self.reload()
+
+    def migrate(self, transaction_mode, batch_size=100):
+        with self.assertRaises(OperationalError):
+            self.upgrade('e', transaction_mode=transaction_mode,
+                         batch_size=batch_size, transactional_ddl=True)
+
+        self.reload()
+
+    def test_all(self):
+        self.migrate(patch.ALL)
+
+        self.assertEqual(self.heads(), [])
+        self.assertEqual(self.history(), [])
+        self.assertFalse(self.has_table('t_b'))
+
+    def test_per_migration(self):
+        self.migrate(patch.PER_MIGRATION)
+
+        self.assertEqual(self.heads(), ['d'])
+        self.assertEqual(self.history(), ['b', 'c', 'd'])
+        self.assertFalse(self.has_table('t_e'))
+
+    def test_batch(self):
+        # batches are initial migration, B, C and then D, E
+        self.migrate(patch.BATCH, batch_size=3)
+
+        self.assertEqual(self.heads(), ['c'])
+        self.assertEqual(self.history(), ['b', 'c'])
+        self.assertTrue(self.has_table('t_c'))
+        self.assertFalse(self.has_table('t_d'))
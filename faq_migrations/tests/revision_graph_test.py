@@ -0,0 +1,65 @@
+import unittest
+
+from faq_migrations.source.revision_graph import RevisionGraph
+from faq_migrations.source.script_index import RevisionHeader
+
+
+class RevisionGraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        #     b - d
+        #   /       \
+        # a           f
+        #   \       /
+        #     c - e
+        headers = [
+            RevisionHeader('a.py', 'a'),
+            RevisionHeader('c.py', 'c', 'a'),
+            RevisionHeader('e.py', 'e', 'c'),
+            RevisionHeader('b.py', 'b', 'a'),
+            RevisionHeader('d.py', 'd', 'b'),
+            RevisionHeader('f.py', 'f', ('d', 'e')),
+        ]
+        self.graph = RevisionGraph(headers)
+
+    def test_rank_and_ancestors(self):
+        self.assertEqual(self.graph.order, ['a', 'c', 'e', 'b', 'd', 'f'])
+        self.assertEqual(self.graph.rank('b'), 3)
+        self.assertTrue(self.graph.is_ancestor('a', 'f'))
+        self.assertTrue(self.graph.is_ancestor('e', 'e'))
+        self.assertFalse(self.graph.is_ancestor('b', 'e'))
+
+        with self.assertRaises(ValueError):
+            self.graph.rank('x')
+
+    def test_merge_base(self):
+        self.assertEqual(self.graph.merge_base('d', 'e'), 'a')
+        self.assertEqual(self.graph.merge_base('d', 'f'), 'd')
+
+    def test_heads(self):
+        graph = self.graph
+
+        self.assertEqual(graph.heads(graph.all), ['f'])
+        self.assertEqual(graph.heads(graph.mask(('d', 'e'))), ['e', 'd'])
+        self.assertEqual(
+            graph.heads(graph.mask(('d', 'e')) & ~graph.bit('d')), ['e', 'b']
+        )
+        self.assertEqual(graph.heads(graph.bit('a') | graph.bit('e')), ['e'])
+        self.assertEqual(graph.heads(0), [])
+
+    def test_descendants(self):
+        graph = self.graph
+
+        self.assertEqual(graph.revisions(graph.descendants(graph.bit('b'))),
+                         ['b', 'd', 'f'])
+        self.assertEqual(graph.revisions(graph.descendants(
+            graph.bit('e') | graph.bit('d'))), ['e', 'd', 'f'])
+        self.assertEqual(graph.descendants(0), 0)
+
+    def test_pending(self):
+        self.assertEqual(self.graph.pending(None),
+                         ['a', 'c', 'e', 'b', 'd', 'f'])
+        self.assertEqual(self.graph.pending('e'), ['b', 'd', 'f'])
+        self.assertEqual(self.graph.pending(('d', 'e'), 'f'), ['f'])
+        self.assertEqual(self.graph.pending('a', 'd'), ['b', 'd'])
+        self.assertEqual(self.graph.pending('f'), [])
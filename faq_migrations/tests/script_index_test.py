@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from faq_migrations.source.alembic_wrapper import LowLevelApi
+from faq_migrations.source.script_index import ScriptIndex, INDEX_FILE
+
+
+MIGRATION = '''"""
+
+{message}
+
+"""
+
+revision = {revision!r}
+down_revision = {down_revision!r}
+branch_labels = None
+depends_on = None
+git_branch = {git_branch!r}
+
+
+def upgrade():
+    pass
+
+
+def downgrade():
+    pass
+'''
+
+
+def load_revisions(alembic_dir):
+    return len(ScriptIndex(alembic_dir).load().revisions)
+
+
+class ScriptIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.alembic_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.alembic_dir, 'versions'))
+
+    def tearDown(self):
+        shutil.rmtree(self.alembic_dir)
+
+    def write(self, revision, down_revision, git_branch='master'):
+        path = os.path.join(self.alembic_dir, 'versions',
+                            '{}.py'.format(revision))
+
+        with open(path, 'w') as migration:
+            migration.write(MIGRATION.format(
+                message='migration {}'.format(revision),
+                revision=revision,
+                down_revision=down_revision,
+                git_branch=git_branch
+            ))
+
+    def test_heads_and_walk(self):
+        self.write('a', None)
+        self.write('b', 'a', 'develop')
+        self.write('c', 'a')
+        self.write('d', ('b', 'c'))
+
+        index = ScriptIndex(self.alembic_dir).load()
+
+        self.assertEqual(index.get_heads(), ['d'])
+        self.assertEqual(
+            [rev.revision for rev in index.walk_revisions()],
+            ['d', 'b', 'c', 'a']
+        )
+        self.assertEqual(
+            [rev.revision for rev in index.iterate_from_base()],
+            ['a', 'c', 'b', 'd']
+        )
+        self.assertEqual(index.get_revision('b').git_branch, 'develop')
+        self.assertEqual(index.get_revision('b').doc, 'migration b')
+        self.assertTrue(index.get_revision('d').is_merge_point)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.alembic_dir, INDEX_FILE))
+        )
+
+    def test_only_changed_files_are_parsed(self):
+        self.write('a', None)
+        self.write('b', 'a')
+        ScriptIndex(self.alembic_dir).load()
+
+        # corrupt cached entry, unchanged file must be answered from index
+        index = ScriptIndex(self.alembic_dir)
+        files = index.__read_index__()
+        files['a.py']['git_branch'] = 'cached'
+        index.__write_index__(files)
+
+        self.write('b', 'a', 'feature')
+        os.utime(os.path.join(self.alembic_dir, 'versions', 'b.py'),
+                 ns=(0, 0))
+
+        index = ScriptIndex(self.alembic_dir).load()
+
+        self.assertEqual(index.get_revision('a').git_branch, 'cached')
+        self.assertEqual(index.get_revision('b').git_branch, 'feature')
+
+    def test_concurrent_cold_load(self):
+        for number in range(50):
+            self.write('r{:03}'.format(number),
+                       'r{:03}'.format(number - 1) if number else None)
+
+        index_path = os.path.join(self.alembic_dir, INDEX_FILE)
+        pool = multiprocessing.get_context('fork').Pool(16)
+
+        try:
+            for _ in range(5):
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+
+                # every process writes index of cold cache at the same time
+                self.assertEqual(
+                    pool.map(load_revisions, [self.alembic_dir] * 16),
+                    [50] * 16
+                )
+        finally:
+            pool.close()
+            pool.join()
+
+        self.assertTrue(os.path.exists(index_path))
+        self.assertEqual([name for name in os.listdir(self.alembic_dir)
+                          if name.endswith('.tmp')], [])
+
+    def test_branch_name(self):
+        self.write('a', None, None)
+        self.write('b', 'a', 'develop')
+
+        index = ScriptIndex(self.alembic_dir).load()
+
+        self.assertEqual(
+            LowLevelApi.__branch_name__(index.get_revision('a')), 'no branch'
+        )
+        self.assertEqual(
+            LowLevelApi.__branch_name__(index.get_revision('b')), 'develop'
+        )
@@ -0,0 +1,104 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+
+from faq_migrations.source.snapshot import SNAPSHOT_VERSION, SchemaSnapshot, \
+    versions_hash
+
+
+class SchemaSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.alembic_dir = tempfile.mkdtemp()
+        self.versions_dir = os.path.join(self.alembic_dir, 'versions')
+        os.makedirs(self.versions_dir)
+
+        with open(os.path.join(self.versions_dir, 'a.py'), 'w') as migration:
+            migration.write('revision = "a"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.alembic_dir)
+
+    def test_capture_restore(self):
+        source = create_engine('sqlite://')
+        source.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, "
+                       "name VARCHAR(20) DEFAULT '100%')")
+        source.execute('CREATE INDEX ix_t_name ON t (name)')
+        source.execute("INSERT INTO t (name) VALUES ('a'), ('b')")
+
+        snapshots = SchemaSnapshot(self.alembic_dir)
+        path = snapshots.path('sqlite', 'a')
+        snapshots.save(path, snapshots.capture(source.connect()))
+
+        target = create_engine('sqlite://')
+        snapshots.restore(target.connect(), snapshots.load(path))
+
+        self.assertEqual(target.execute('SELECT * FROM t').fetchall(),
+                         [(1, 'a'), (2, 'b')])
+        self.assertEqual(
+            target.dialect.get_indexes(target.connect(), 't')[0]['name'],
+            'ix_t_name'
+        )
+
+    def test_typed_values(self):
+        source = create_engine('sqlite://')
+        source.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, '
+                       'created DATETIME, price NUMERIC(10, 2), data BLOB)')
+        row = (1, datetime(2020, 1, 2, 3, 4, 5, 6), Decimal('1.25'),
+               b'\x00\xff')
+        source.execute('INSERT INTO t VALUES (?, ?, ?, ?)',
+                       row[0], row[1].isoformat(' '), '1.25', row[3])
+
+        snapshots = SchemaSnapshot(self.alembic_dir)
+        path = snapshots.path('sqlite', 'a')
+        self.assertTrue(
+            snapshots.save(path, snapshots.capture(source.connect()))
+        )
+
+        # snapshot is data only
+        with open(path) as snapshot_file:
+            self.assertEqual(json.load(snapshot_file)['version'],
+                             SNAPSHOT_VERSION)
+
+        target = create_engine('sqlite://')
+        snapshots.restore(target.connect(), snapshots.load(path))
+
+        restored = SchemaSnapshot.capture(target.connect())['rows']
+        self.assertEqual(restored, [('t', [dict(zip(
+            ('id', 'created', 'price', 'data'), row
+        ))])])
+
+    def test_unsupported_objects(self):
+        engine = create_engine('sqlite://')
+        connection = engine.connect()
+        connection.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, '
+                           'name VARCHAR(20) CHECK (name <> \'\'))')
+
+        self.assertEqual(SchemaSnapshot.unsupported(connection), [])
+
+        connection.execute('CREATE VIEW v AS SELECT name FROM t')
+        connection.execute('CREATE TRIGGER tr AFTER INSERT ON t BEGIN '
+                           'DELETE FROM t WHERE 0; END')
+
+        self.assertEqual(sorted(SchemaSnapshot.unsupported(connection)),
+                         ['trigger tr', 'view v'])
+
+    def test_key_depends_on_files(self):
+        snapshots = SchemaSnapshot(self.alembic_dir)
+        digest = versions_hash(self.versions_dir)
+        path = snapshots.path('sqlite', 'a')
+
+        snapshots.save(path, dict(version=SNAPSHOT_VERSION, statements=[],
+                                  rows=[]))
+
+        with open(os.path.join(self.versions_dir, 'b.py'), 'w') as migration:
+            migration.write('revision = "b"\n')
+
+        self.assertNotEqual(versions_hash(self.versions_dir), digest)
+        self.assertIsNone(snapshots.load(snapshots.path('sqlite', 'a')))
@@ -0,0 +1,76 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from faq_migrations.source import sql_cache
+from faq_migrations.source.sql_cache import SqlCache
+
+
+class SqlCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.alembic_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.alembic_dir, 'a.py')
+        self.rendered = 0
+
+        with open(self.path, 'w') as migration:
+            migration.write('revision = "a"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.alembic_dir)
+
+    def render(self, dialect='postgresql', **opts):
+        impl = SimpleNamespace(output_buffer=io.StringIO())
+        context = SimpleNamespace(dialect=SimpleNamespace(name=dialect),
+                                  impl=impl,
+                                  opts=dict(opts, literal_binds=True,
+                                            fn=self.render))
+
+        def upgrade():
+            self.rendered += 1
+            impl.output_buffer.write('CREATE TABLE a (id INTEGER);\n\n')
+
+        step = SimpleNamespace(migration_fn=upgrade,
+                               revision=SimpleNamespace(path=self.path))
+
+        SqlCache(self.alembic_dir).wrap(step, context).migration_fn()
+        self.assertEqual(step.migration_fn.__name__, 'upgrade')
+
+        return impl.output_buffer.getvalue()
+
+    def test_unchanged_file_is_rendered_once(self):
+        self.assertEqual(self.render(), 'CREATE TABLE a (id INTEGER);\n\n')
+        self.assertEqual(self.render(), 'CREATE TABLE a (id INTEGER);\n\n')
+        self.assertEqual(self.rendered, 1)
+
+        self.render('sqlite')
+        self.assertEqual(self.rendered, 2)
+
+        with open(self.path, 'a') as migration:
+            migration.write('# changed\n')
+
+        self.render()
+        self.assertEqual(self.rendered, 3)
+
+    def test_environment_is_part_of_key(self):
+        self.render(starting_rev='a')
+        self.render(destination_rev='b')
+        self.assertEqual(self.rendered, 1)
+
+        self.render(render_as_batch=True)
+        self.assertEqual(self.rendered, 2)
+
+        with open(os.path.join(self.alembic_dir, 'env.py'), 'w') as env:
+            env.write('# changed\n')
+
+        self.render()
+        self.assertEqual(self.rendered, 3)
+
+        with mock.patch.object(sql_cache.sqlalchemy, '__version__', '0.0'):
+            self.render()
+
+        self.assertEqual(self.rendered, 4)
@@ -0,0 +1,84 @@
+import os
+import unittest
+
+from alembic.util import CommandError
+
+from faq_migrations.settings import config
+from faq_migrations.source.alembic_wrapper import AlembicMigrations, \
+    CompareLocalRemote
+from faq_migrations.tests.workspace import Workspace
+
+
+class SquashTestCase(Workspace, unittest.TestCase):
+    """
+    Chain B -> C -> D of the initial migration, database is at C
+    """
+
+    def setUp(self):
+        super(SquashTestCase, self).setUp()
+
+        self.write('b', self.base)
+        self.write('c', 'b')
+        self.write('d', 'c')
+        self.reload()
+
+        self.upgrade('c')
+
+    def versions(self):
+        return sorted(os.listdir(os.path.join(config.alembic_dir,
+                                              'versions')))
+
+    def test_baseline(self):
+        path = self.am.squash('c')
+
+        self.assertEqual(self.versions(), ['c_baseline.py', 'd.py'])
+        self.assertTrue(os.path.exists(os.path.join(
+            config.alembic_dir, 'squashed', 'c', 'b.py'
+        )))
+
+        # database at squashed revision is upgraded by the rest
+        self.reload()
+        self.assertEqual(self.am.index.get_revision('c').path, path)
+        self.assertTrue(self.am.migrate())
+        self.assertEqual(self.history(), ['b', 'c', 'd'])
+
+        # new database is created by baseline with history of squashed
+        # revisions
+        config.database_url = fresh = self.database('fresh')
+        migrations = AlembicMigrations(fresh)
+
+        try:
+            self.assertTrue(migrations.migrate())
+            self.assertEqual(migrations.context.get_current_heads(), ('d', ))
+
+            for table in ('t_b', 't_c', 't_d'):
+                self.assertTrue(
+                    migrations.engine.dialect.has_table(migrations.conn,
+                                                        table)
+                )
+        finally:
+            migrations.close()
+
+        CompareLocalRemote().compare_history()
+
+    def test_forked_range_is_refused(self):
+        # `e` is based on `b`, which would be squashed
+        self.write('e', 'b')
+        self.reload()
+        versions = self.versions()
+
+        with self.assertRaises(CommandError):
+            self.am.squash('c')
+
+        self.assertEqual(self.versions(), versions)
+
+    def test_unsupported_objects_are_refused(self):
+        versions = self.versions()
+        self.am.conn.execute('CREATE VIEW v AS SELECT id FROM t_b')
+        self.am.conn.execute('INSERT INTO t_c (id) VALUES (1)')
+
+        with self.assertRaisesRegex(CommandError,
+                                    'view v, rows of table t_c'):
+            self.am.squash('c')
+
+        self.assertEqual(self.versions(), versions)
@@ -0,0 +1,58 @@
+import os
+import unittest
+from unittest import mock
+
+from faq_migrations.source.alembic_wrapper import AlembicMigrations, \
+    AT_HEAD, FAILED, SUCCEEDED
+from faq_migrations.tests.workspace import Workspace
+
+
+class MigrateTargetsTestCase(Workspace, unittest.TestCase):
+    """
+    Chain B -> C of the initial migration is applied to databases `one`,
+    `two` and the workspace database, which is already at head
+    """
+
+    def setUp(self):
+        super(MigrateTargetsTestCase, self).setUp()
+
+        self.write('b', self.base)
+        self.write('c', 'b')
+        self.reload()
+
+        self.assertTrue(self.am.migrate())
+
+        self.urls = [self.database('one'), self.url, self.database('two'),
+                     'sqlite:///{}'.format(os.path.join(self.work_dir,
+                                                        'missing', 'x.db'))]
+
+    def check(self, results):
+        self.assertEqual([(url, status) for url, status, _ in results],
+                         list(zip(self.urls, (SUCCEEDED, AT_HEAD, SUCCEEDED,
+                                              FAILED))))
+        self.assertIn('OperationalError', results[-1][2])
+
+        for url in self.urls[:3]:
+            migrations = AlembicMigrations(url)
+
+            try:
+                self.assertEqual(migrations.context.get_current_heads(),
+                                 ('c', ))
+            finally:
+                migrations.close()
+
+    def test_fork(self):
+        with mock.patch('multiprocessing.get_start_method',
+                        return_value='fork'):
+            self.check(AlembicMigrations.migrate_targets(self.urls, jobs=2))
+
+    def test_spawn(self):
+        with mock.patch('multiprocessing.get_start_method',
+                        return_value='spawn'):
+            self.check(AlembicMigrations.migrate_targets(self.urls, jobs=2))
+
+    def test_many_heads(self):
+        self.write('d', 'b')
+        results = AlembicMigrations.migrate_targets(self.urls)
+
+        self.assertEqual({status for _, status, _ in results}, {FAILED})
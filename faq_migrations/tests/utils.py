@@ -1,10 +1,42 @@
+import atexit
 import os
+import shutil
 import git
 
-from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
 from sqlalchemy_utils import database_exists, create_database, drop_database
 
-from faq_migrations.source.alembic_wrapper import AlembicMigrations
+from faq_migrations.models import get_engine
+from faq_migrations.settings import config
+from faq_migrations.source.alembic_wrapper import AlembicMigrations, \
+    LOCAL_CACHES
+from faq_migrations.source.snapshot import versions_hash
+
+
+# template databases migrated by this test run, they are dropped at exit
+_templates = {}
+
+
+def drop_templates():
+    """
+    Drop template databases migrated by this test run
+    """
+    while _templates:
+        _, template = _templates.popitem()
+        template.remove(None)
+
+
+def configure(alembic_dir='alembic/'):
+    """
+    Point config to alembic directory of git repository of current directory
+    and to templates of the package
+    """
+    config.alembic_dir = alembic_dir
+    config.template_path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'templates'
+    ) + os.sep
+    config.template_name = 'git-generic'
 
 
 class Database:
@@ -17,21 +49,38 @@ class Database:
                  host='localhost',
                  port='5432'):
 
-        self.engine = None
-        self.url = f'{driver}://{login}:{password}@{host}:{port}/{db_name}'
+        self.db_name = db_name
+        self.options = dict(driver=driver, login=login, password=password,
+                            host=host, port=port)
+
+        if driver.startswith('sqlite'):
+            self.url = f'{driver}:///{db_name}.sqlite'
+        else:
+            self.url = f'{driver}://{login}:{password}@{host}:{port}/{db_name}'
 
     @property
-    def url(self):
-        return self.engine.url
+    def engine(self):
+        # engines are pooled per url and shared between sessions
+        return get_engine(self.url)
 
-    @url.setter
-    def url(self, db_url):
-        self.engine = create_engine(db_url)
+    @property
+    def is_sqlite(self):
+        return self.url.startswith('sqlite')
+
+    @property
+    def is_empty(self):
+        return not self.engine.table_names()
+
+    def sibling(self, db_name):
+        """
+        Database with the same connection params
+        """
+        return Database(db_name=db_name, **self.options)
 
     def create(self):
 
-        if not database_exists(self.engine.url):
-            create_database(self.engine.url)
+        if not database_exists(self.url):
+            create_database(self.url)
 
     def remove(self, db_name):
 
@@ -40,24 +89,63 @@ class Database:
             new_url[-1] = db_name
             self.url = '/'.join(new_url)
 
-        if database_exists(self.engine.url):
-            drop_database(self.engine.url)
+        # pooled connections prevent dropping of database
+        self.engine.dispose()
+
+        if database_exists(self.url):
+            drop_database(self.url)
+
+    def clone(self, template):
+        """
+        Create database as copy of migrated template database
+        """
+        if self.is_sqlite:
+            shutil.copyfile(make_url(template.url).database,
+                            make_url(self.url).database)
+            return
+
+        # source database of TEMPLATE must not have connections
+        template.engine.dispose()
+
+        maintenance_url = make_url(self.url)
+        maintenance_url.database = 'postgres'
+        maintenance = get_engine(str(maintenance_url)).execution_options(
+            isolation_level='AUTOCOMMIT'
+        )
+
+        maintenance.execute(
+            f'CREATE DATABASE "{self.db_name}" TEMPLATE "{template.db_name}"'
+        )
 
 
 class AlembicSession:
 
-    def __init__(self, db_name):
+    def __init__(self, db_name, **options):
         self.db_name = db_name
 
-        self.db = Database(db_name=db_name)
+        self.db = Database(db_name=db_name, **options)
         self.db.create()
 
-        self.alembic = AlembicMigrations(Database(db_name=db_name).url)
+        # alembic.ini is read by AlembicMigrations, it is created by init()
+        self._alembic = None
         self.repo = git.Repo('')
         self.set_active_branch()
         self.initial_revision = self.repo.index.version
         print(f'current {db_name} revision is {self.initial_revision}')
 
+    @property
+    def alembic(self):
+        if self._alembic is None:
+            self._alembic = AlembicMigrations(self.db.url)
+
+        return self._alembic
+
+    def init(self):
+        """
+        Initialize alembic directory, sessions load it on first use
+        """
+        AlembicMigrations.init()
+
     @property
     def branch(self):
         return self.repo.branches[self.db_name]
@@ -76,6 +164,50 @@ class AlembicSession:
         getattr(self.repo.heads, future_branch).checkout()
         print(f'GIT: branch switched to: {self.repo.active_branch}')
 
+    def template(self, head):
+        """
+        Database migrated to head, it is migrated once per head and content
+        of migration files
+        """
+        template = self.db.sibling('template_{}_{}'.format(
+            head, versions_hash(os.path.join(config.alembic_dir,
+                                             'versions'))[:8]
+        ))
+
+        if template.db_name not in _templates:
+            if not _templates:
+                atexit.register(drop_templates)
+
+            template.remove(None)
+            template.create()
+
+            alembic = AlembicMigrations(template.url)
+            alembic.migrate()
+            alembic.close()
+
+            _templates[template.db_name] = template
+
+        return _templates[template.db_name]
+
+    def migrate(self):
+        """
+        Migrate database of session. Empty database is cloned from template
+        database instead of running of all migrations
+        """
+        heads = list(self.alembic.heads)
+
+        if len(heads) != 1 or not self.db.is_empty:
+            return self.alembic.migrate()
+
+        template = self.template(heads[0].revision)
+
+        self.alembic.close()
+        self.db.remove(None)
+        self.db.clone(template)
+        self._alembic = None
+
+        return True
+
     def commit(self, name):
         self.repo.index.add(list(self.untracked_files))
         self.repo.index.commit(name)
@@ -103,7 +235,7 @@ class AlembicSession:
         self.repo.delete_head(getattr(self.repo.heads, self.db_name))
         self.drop_db()
 
-        os.remove('alembic/')
+        shutil.rmtree('alembic/', ignore_errors=True)
 
     def reset_to_initial(self):
         self.repo.index.reset(commit=self.initial_revision)
@@ -111,6 +243,10 @@ class AlembicSession:
     @property
     def untracked_files(self):
 
+        caches = [os.path.join(config.alembic_dir, name)
+                  for name in LOCAL_CACHES]
+
         for file in self.repo.untracked_files:
-            if file.startswith('alembic') and not file.endswith('__'):
+            if file.startswith('alembic') and not file.endswith('__') and \
+                    not file.startswith(tuple(caches)):
                 yield file
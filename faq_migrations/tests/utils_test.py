@@ -0,0 +1,94 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from faq_migrations.models import dispose_engine
+from faq_migrations.settings import config
+from faq_migrations.tests import utils
+from faq_migrations.tests.utils import AlembicSession, configure, \
+    drop_templates
+
+
+class AlembicSessionTestCase(unittest.TestCase):
+    """
+    Sessions of SQLite databases in temporary git repository
+    """
+
+    def setUp(self):
+        self.saved = {name: getattr(config, name) for name in
+                      ('alembic_dir', 'template_path', 'template_name')}
+        self.cwd = os.getcwd()
+        self.path = tempfile.mkdtemp()
+        os.chdir(self.path)
+
+        for args in (('init', '-q'), ('checkout', '-q', '-b', 'master'),
+                     ('commit', '-q', '--allow-empty', '-m', 'initial')):
+            subprocess.check_call(('git', '-c', 'user.name=test', '-c',
+                                   'user.email=test@test') + args)
+
+        configure()
+        self.sessions = []
+
+    def tearDown(self):
+        drop_templates()
+
+        for session in self.sessions:
+            session.alembic.close()
+            dispose_engine(session.db.url)
+
+        os.chdir(self.cwd)
+        shutil.rmtree(self.path)
+
+        for name, value in self.saved.items():
+            setattr(config, name, value)
+
+    def session(self, db_name):
+        session = AlembicSession(db_name, driver='sqlite')
+        self.sessions.append(session)
+        return session
+
+    def test_clone_of_template(self):
+        master = self.session('master')
+        master.init()
+
+        for name in ('one', 'two'):
+            master.alembic.create(name)
+
+        master.commit('master')
+        head = list(master.alembic.heads)[0].revision
+
+        # caches of checkout are ignored by git
+        files = subprocess.check_output(('git', 'ls-files'),
+                                        universal_newlines=True).split()
+
+        self.assertIn('alembic/.gitignore', files)
+        self.assertNotIn('alembic/.revision_index.json', files)
+        self.assertTrue(os.path.exists('alembic/.revision_index.json'))
+        self.assertEqual(subprocess.check_output(
+            ('git', 'status', '--porcelain', 'alembic')
+        ), b'')
+
+        self.assertTrue(master.migrate())
+        self.assertEqual(master.alembic.current(), head)
+        self.assertEqual(len(utils._templates), 1)
+
+        template, = utils._templates.values()
+        template_file = os.path.join(self.path, template.db_name + '.sqlite')
+
+        self.assertTrue(os.path.exists(template_file))
+
+        # the next empty database is cloned from the same template
+        develop = self.session('develop')
+
+        self.assertTrue(develop.migrate())
+        self.assertEqual(develop.alembic.current(), head)
+        self.assertEqual(list(utils._templates.values()), [template])
+
+        # database with schema is migrated
+        self.assertIsNone(develop.migrate())
+
+        drop_templates()
+
+        self.assertFalse(os.path.exists(template_file))
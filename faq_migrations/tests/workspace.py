@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+
+from sqlalchemy import select
+
+from faq_migrations import patch
+from faq_migrations.models import dispose_engine
+from faq_migrations.models.history import VersionHistory, \
+    ensure_history_table
+from faq_migrations.settings import config
+from faq_migrations.source.alembic_wrapper import AlembicMigrations
+
+
+MIGRATION = '''"""
+
+{revision}
+
+"""
+
+revision = {revision!r}
+down_revision = {down_revision!r}
+branch_labels = None
+depends_on = None
+git_branch = {git_branch!r}
+
+from alembic.op import create_table, drop_table, execute
+from sqlalchemy import Column, Integer
+
+
+def upgrade():
+    create_table('t_{revision}', Column('id', Integer, primary_key=True))
+{fail}
+
+def downgrade():
+    drop_table('t_{revision}')
+'''
+
+# statement of migration which fails after its table is created
+FAIL = "    execute('SELECT * FROM missing_table')\n"
+
+
+class Workspace:
+    """
+    Mixin of test cases which run migrations of temporary alembic directory
+    against SQLite file. Every migration creates table `t_<revision>`
+    """
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.saved = {name: getattr(config, name) for name in
+                      ('alembic_dir', 'template_path', 'template_name',
+                       'database_url')}
+
+        config.alembic_dir = os.path.join(self.work_dir, 'alembic') + os.sep
+        config.template_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            'templates'
+        ) + os.sep
+        config.template_name = 'git-generic'
+        config.database_url = self.url = self.database('db')
+
+        AlembicMigrations.init()
+
+        self.base = AlembicMigrations(self.url).index.get_heads()[0]
+        self.am = AlembicMigrations(self.url)
+
+    def tearDown(self):
+        self.am.close()
+
+        for name, value in self.saved.items():
+            setattr(config, name, value)
+
+        shutil.rmtree(self.work_dir)
+
+    def database(self, name):
+        """
+        Url of SQLite file inside of workspace
+        """
+        url = 'sqlite:///{}'.format(
+            os.path.join(self.work_dir, '{}.sqlite'.format(name))
+        )
+
+        # engines are pooled per url, files are removed with workspace
+        self.addCleanup(dispose_engine, url)
+
+        return url
+
+    def write(self, revision, down_revision, fail=False, git_branch='master'):
+        path = os.path.join(config.alembic_dir, 'versions',
+                            '{}.py'.format(revision))
+
+        with open(path, 'w') as migration:
+            migration.write(MIGRATION.format(revision=revision,
+                                             down_revision=down_revision,
+                                             fail=FAIL if fail else '',
+                                             git_branch=git_branch))
+
+    def reload(self):
+        """
+        Session which sees migration files written after its creation
+        """
+        self.am.close()
+        self.am = AlembicMigrations(self.url)
+
+    def upgrade(self, destination, **options):
+        ensure_history_table(self.am.conn)
+        patch.install()
+
+        def upgrade(revision, context):
+            return self.am.script._upgrade_revs(destination, revision)
+
+        self.am.__run_env__(upgrade, starting_rev=None,
+                            destination_rev=destination, **options)
+
+    def heads(self):
+        return sorted(self.am.context.get_current_heads())
+
+    def history(self):
+        history = VersionHistory.__table__
+
+        return [row.to_ver for row in self.am.conn.execute(
+            select([history.c.to_ver]).where(VersionHistory.applied())
+            .order_by(history.c.id)
+        )]
+
+    def has_table(self, name):
+        return self.am.engine.dialect.has_table(self.am.conn, name)